@@ -0,0 +1,67 @@
+"""Time e-graph saturation and extraction on arithmetic simplification rules.
+
+Run with ``python benchmarks/bench_egraph.py``.
+"""
+
+import timeit
+from operator import add, mul, neg, sub
+
+from unification import var
+
+from etuples import etuple
+from etuples.egraph import EGraph
+
+x_lv, y_lv, z_lv = var(), var(), var()
+
+rules = {
+    "identities": [
+        (etuple(add, x_lv, 0), x_lv),
+        (etuple(mul, x_lv, 1), x_lv),
+        (etuple(mul, x_lv, 0), 0),
+        (etuple(sub, x_lv, x_lv), 0),
+        (etuple(neg, etuple(neg, x_lv)), x_lv),
+    ],
+}
+rules["identities+comm"] = rules["identities"] + [
+    (etuple(add, x_lv, y_lv), etuple(add, y_lv, x_lv)),
+    (etuple(mul, x_lv, y_lv), etuple(mul, y_lv, x_lv)),
+]
+rules["identities+comm+assoc"] = rules["identities+comm"] + [
+    (
+        etuple(add, etuple(add, x_lv, y_lv), z_lv),
+        etuple(add, x_lv, etuple(add, y_lv, z_lv)),
+    ),
+]
+
+
+def make_expr(n):
+    """Build a sum of `n` terms like ``(x_i * 1 + 0) - (y - y)``."""
+    res = 0
+    for i in range(n):
+        term = etuple(
+            sub,
+            etuple(add, etuple(mul, f"x{i}", 1), 0),
+            etuple(sub, "y", "y"),
+        )
+        res = etuple(add, res, term)
+    return res
+
+
+def run(expr, rule_set):
+    eg = EGraph()
+    cid = eg.add(expr)
+    eg.saturate(rule_set, max_iters=10, max_nodes=5000)
+    return eg, eg.extract(cid)
+
+
+if __name__ == "__main__":
+    for name, rule_set in rules.items():
+        for n in (5, 20, 80):
+            expr = make_expr(n)
+            number = 3
+            t = timeit.timeit(lambda: run(expr, rule_set), number=number) / number
+            eg, _ = run(expr, rule_set)
+            print(
+                f"{name:>24} n={n:<3} classes={len(eg):<6} "
+                f"nodes={eg.num_nodes:<6} time={t * 1000:.1f} ms"
+            )
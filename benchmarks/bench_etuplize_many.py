@@ -0,0 +1,59 @@
+"""Time `etuplize_many` with process pools of increasing size.
+
+Run with ``python benchmarks/bench_etuplize_many.py``.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from etuples import etuplize_many, rands, rator
+
+
+class Op:
+    """A picklable operator."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, *args):
+        return Node(self, list(args))
+
+
+class Node:
+    """A small model object with `rator`/`rands` support."""
+
+    def __init__(self, op, args):
+        self.op, self.args = op, args
+
+
+rator.add((Node,), lambda x: x.op)
+rands.add((Node,), lambda x: x.args)
+
+add, mul = Op("add"), Op("mul")
+
+
+def make_model(i, depth=20):
+    """Build a model object with about ``2 * depth`` nodes."""
+    res = Node(add, [i, 1])
+    for j in range(depth):
+        res = Node(mul if j % 2 else add, [res, Node(add, [j, i])])
+    return res
+
+
+if __name__ == "__main__":
+    objs = [make_model(i) for i in range(2000)]
+
+    start = time.perf_counter()
+    etuplize_many(objs)
+    serial = time.perf_counter() - start
+    print(f"{'serial':>10} time={serial:.2f} s")
+
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            start = time.perf_counter()
+            etuplize_many(objs, executor=executor, chunksize=100)
+            t = time.perf_counter() - start
+        print(f"{workers:>3} workers time={t:.2f} s speedup={serial / t:.2f}")
+        workers *= 2
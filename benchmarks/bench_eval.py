@@ -0,0 +1,51 @@
+"""Time repeated evaluations of `ExpressionTuple`s.
+
+The cached evaluations are cleared between runs, so every node is evaluated
+each time.
+
+Run with ``python benchmarks/bench_eval.py``.
+"""
+
+import timeit
+from operator import add, mul
+
+from etuples import etuple
+from etuples.core import ExpressionTuple
+
+
+def scale(x, factor=1, offset=0):
+    return x * factor + offset
+
+
+def make_term(depth):
+    """Build a chain of `depth` arithmetic operations."""
+    res = etuple(scale, 1, offset=1)
+    for i in range(depth):
+        res = etuple(add if i % 2 else mul, res, 1)
+    return res
+
+
+def nodes(x):
+    stack = [x]
+    while stack:
+        x = stack.pop()
+        yield x
+        stack.extend(i for i in x._tuple if isinstance(i, ExpressionTuple))
+
+
+def clear(x):
+    for n in nodes(x):
+        n._evaled_obj = ExpressionTuple.null
+
+
+def run(term):
+    clear(term)
+    return term.evaled_obj
+
+
+if __name__ == "__main__":
+    for depth in (10, 100, 1000):
+        term = make_term(depth)
+        number = max(1, 20000 // depth)
+        t = timeit.timeit(lambda: run(term), number=number) / number
+        print(f"depth={depth:<5} time={t * 1000:.3f} ms")
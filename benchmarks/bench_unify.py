@@ -0,0 +1,54 @@
+"""Time the unification and reification of `ExpressionTuple`s.
+
+Run with ``python benchmarks/bench_unify.py``.
+"""
+
+import timeit
+from operator import add, mul
+
+from unification import reify, unify, var
+
+from etuples import etuple
+
+
+def make_term(depth, leaf=1):
+    """Build a balanced binary term with ``2**depth`` leaves."""
+    if depth == 0:
+        return leaf
+    return etuple(
+        add if depth % 2 else mul,
+        make_term(depth - 1, leaf),
+        make_term(depth - 1, leaf),
+    )
+
+
+if __name__ == "__main__":
+    x_lv, y_lv = var(), var()
+
+    for depth in (4, 8, 12):
+        term = make_term(depth)
+        same = make_term(depth)
+        pattern = make_term(depth, x_lv)
+        # The operator differs at the root, so unification fails right away
+        mismatch = etuple(mul, *term[1:]) if term[0] is add else etuple(add, *term[1:])
+        # Only the left-most leaf is a logic variable
+        partial = make_term(depth)
+        sub = partial
+        while sub[1] != 1:
+            sub = sub[1]
+        left = etuple(sub[0], y_lv, sub[2])
+        s = unify(pattern, term, {})
+
+        cases = {
+            "unify equal": lambda: unify(term, same, {}),
+            "unify pattern": lambda: unify(pattern, term, {}),
+            "unify mismatch": lambda: unify(mismatch, term, {}),
+            "reify pattern": lambda: reify(pattern, s),
+            "reify ground": lambda: reify(term, s),
+            "reify one var": lambda: reify(etuple(add, left, term), {y_lv: 2}),
+        }
+
+        for name, fn in cases.items():
+            number = max(1, 2000 // 2**depth)
+            t = timeit.timeit(fn, number=number) / number
+            print(f"{name:>16} depth={depth:<3} time={t * 1000:.3f} ms")
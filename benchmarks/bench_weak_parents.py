@@ -0,0 +1,43 @@
+"""Compare the memory retained by slices with strong and weak parent links.
+
+Run with ``python benchmarks/bench_weak_parents.py``.
+"""
+
+import gc
+import tracemalloc
+
+from etuples import etuple, rands
+from etuples.core import ExpressionTuple
+
+
+def make_expr(i, n=10000):
+    """Build an evaluated expression with a large cached result."""
+    res = etuple(list, etuple(range, i, i + n))
+    res.evaled_obj
+    return res
+
+
+def retained(weak_parents, count=200):
+    """Return the bytes retained by `count` slices of dropped expressions."""
+    ExpressionTuple.weak_parents = weak_parents
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        # Keep a `rands` slice of each expression, like a substitution map would
+        slices = [rands(make_expr(i)) for i in range(count)]
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+        ExpressionTuple.weak_parents = False
+
+    del slices
+    return size
+
+
+if __name__ == "__main__":
+    strong = retained(False)
+    weak = retained(True)
+    print(f"  strong parents: {strong / 2**20:.2f} MiB")
+    print(f"    weak parents: {weak / 2**20:.2f} MiB ({weak / strong:.1%})")
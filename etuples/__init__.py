@@ -1,6 +1,25 @@
-import importlib.metadata
+from .analysis import diff, stats
+from .core import canonical_key, etuple
+from .dispatch import (
+    apply,
+    arguments,
+    etuplize,
+    etuplize_many,
+    operator,
+    rands,
+    rator,
+    term,
+)
 
-from .core import etuple
-from .dispatch import apply, arguments, etuplize, operator, rands, rator, term
 
-__version__ = importlib.metadata.version("etuples")
+def __getattr__(name):
+    # The version lookup searches the installed distributions, so it's only
+    # done when requested.
+    if name == "__version__":
+        import importlib.metadata
+
+        global __version__
+        __version__ = importlib.metadata.version("etuples")
+        return __version__
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
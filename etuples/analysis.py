@@ -0,0 +1,208 @@
+import sys
+import weakref
+from collections import namedtuple
+
+from .core import ExpressionTuple, KwdPair
+
+Edit = namedtuple("Edit", ("kind", "path", "old", "new"))
+Edit.__doc__ = """An edit produced by `diff`.
+
+``kind`` is one of ``"replace"``, ``"insert"`` or ``"remove"``, and ``path``
+is the `tuple` of element indices leading to the edited element.  Inserted
+elements have no ``old`` value and removed ones have no ``new`` value (i.e.
+they're ``None``).
+"""
+
+_INSERTED, _REMOVED = object(), object()
+
+
+def _equal(x, y):
+    if x is y:
+        return True
+
+    if isinstance(x, ExpressionTuple) and isinstance(y, ExpressionTuple):
+        try:
+            if hash(x) != hash(y):
+                return False
+        except TypeError:
+            pass
+
+    try:
+        return bool(x == y)
+    except (TypeError, ValueError):
+        return False
+
+
+def diff(a, b):
+    """Return the edits that turn the expression `a` into `b`.
+
+    Nested `ExpressionTuple`s are compared element-wise: elements in a common
+    prefix and suffix are matched, the remaining elements are paired up and
+    compared in turn, and any leftover elements are reported as removed (from
+    `a`) or inserted (into `b`).  Everything else that differs is replaced.
+
+    Identical objects, and `ExpressionTuple`s with different (cached) hashes,
+    are dealt with without looking inside them, so the cost of comparing two
+    large expressions that share most of their sub-expressions is roughly
+    proportional to the size of the changes and their depth.
+
+    The paths of removed elements are positions in `a`, and those of inserted
+    elements are positions in `b`.  `KwdPair` values are compared when their
+    keywords match, and their paths are the paths of the `KwdPair`s.
+
+    Returns
+    -------
+    A `list` of `Edit`s in pre-order.
+    """
+    edits = []
+    stack = [((), a, b)]
+
+    while stack:
+        path, x, y = stack.pop()
+
+        if x is y:
+            continue
+
+        if isinstance(x, ExpressionTuple) and isinstance(y, ExpressionTuple):
+            if _equal(x, y):
+                continue
+
+            xs, ys = x._tuple, y._tuple
+            n, m = len(xs), len(ys)
+
+            start = 0
+            while start < min(n, m) and _equal(xs[start], ys[start]):
+                start += 1
+
+            end = 0
+            while end < min(n, m) - start and _equal(xs[n - 1 - end], ys[m - 1 - end]):
+                end += 1
+
+            paired = min(n, m) - start - end
+            children = [
+                (path + (i,), xs[i], ys[i]) for i in range(start, start + paired)
+            ]
+
+            if n > m:
+                children.extend(
+                    (path + (i,), xs[i], _REMOVED)
+                    for i in range(start + paired, n - end)
+                )
+            elif m > n:
+                children.extend(
+                    (path + (i,), _INSERTED, ys[i])
+                    for i in range(start + paired, m - end)
+                )
+
+            stack.extend(reversed(children))
+        elif x is _INSERTED:
+            edits.append(Edit("insert", path, None, y))
+        elif y is _REMOVED:
+            edits.append(Edit("remove", path, x, None))
+        elif isinstance(x, KwdPair) and isinstance(y, KwdPair) and x.arg == y.arg:
+            stack.append((path, x.value, y.value))
+        elif not _equal(x, y):
+            edits.append(Edit("replace", path, x, y))
+
+    return edits
+
+
+Stats = namedtuple(
+    "Stats",
+    (
+        "nodes",
+        "distinct_nodes",
+        "depth",
+        "max_arity",
+        "evaluated",
+        "evaluated_bytes",
+        "parent_links",
+    ),
+)
+Stats.__doc__ = """Statistics about an expression, as computed by `stats`.
+
+``nodes`` is the number of `ExpressionTuple`s in the expression when it's
+viewed as a tree, and ``distinct_nodes`` is the number of distinct ones (i.e.
+when shared sub-expressions are counted once).  ``depth`` is the maximum number
+of nested `ExpressionTuple`s and ``max_arity`` is the maximum number of
+operands.  The other fields count the distinct nodes with cached evaluations
+(and the shallow size in bytes of those evaluations) and with (strong)
+references to the parents they were sliced from.
+"""
+
+
+def _node_key(x):
+    # Arena handles are created on access, so they're identified by node.  The
+    # check is duck-typed, so that `etuples.arena` isn't imported with `etuples`.
+    arena = getattr(x, "_arena", None)
+    if arena is not None:
+        return (id(arena), x._index)
+    return id(x)
+
+
+def stats(x):
+    """Return `Stats` for the expression `x`.
+
+    The expression is walked without recursion and each distinct
+    `ExpressionTuple` is visited once, so this is cheap even for large,
+    heavily shared expressions.  `ExpressionTuple`s in `KwdPair` values are
+    included.  The byte sizes of the cached evaluations are estimated with
+    `sys.getsizeof`, so the objects they reference aren't included, and
+    evaluations shared between nodes are only counted once.
+    """
+    if not isinstance(x, ExpressionTuple):
+        raise TypeError(f"Expected an ExpressionTuple, got {type(x)}")
+
+    # Map node keys to `(node, children, tree size, depth)`; the nodes are kept
+    # so that their `id`s can't be reused while we're walking.
+    info = {}
+    evaled_ids = set()
+    distinct = max_arity = evaluated = evaluated_bytes = parent_links = 0
+    stack = [(x, None)]
+
+    while stack:
+        t, children = stack.pop()
+        key = _node_key(t)
+
+        if children is None:
+            if key in info:
+                continue
+
+            children = []
+            for i in t._tuple:
+                if isinstance(i, KwdPair):
+                    i = i.value
+                if isinstance(i, ExpressionTuple):
+                    children.append(i)
+
+            stack.append((t, children))
+            stack.extend((c, None) for c in children if _node_key(c) not in info)
+            continue
+
+        if key in info:
+            continue
+
+        child_info = [info[_node_key(c)] for c in children]
+        size = 1 + sum(c[2] for c in child_info)
+        depth = 1 + max((c[3] for c in child_info), default=0)
+        info[key] = (t, None, size, depth)
+
+        distinct += 1
+        max_arity = max(max_arity, len(t) - 1)
+
+        evaled_obj = t._evaled_obj
+        if evaled_obj is not ExpressionTuple.null:
+            evaluated += 1
+            if id(evaled_obj) not in evaled_ids:
+                evaled_ids.add(id(evaled_obj))
+                evaluated_bytes += sys.getsizeof(evaled_obj)
+
+        # Weak links don't keep parents alive
+        if t._parent is not None and not isinstance(t._parent, weakref.ref):
+            parent_links += 1
+
+    _, _, size, depth = info[_node_key(x)]
+
+    return Stats(
+        size, distinct, depth, max_arity, evaluated, evaluated_bytes, parent_links
+    )
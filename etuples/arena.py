@@ -0,0 +1,296 @@
+from array import array
+
+from . import core
+from .core import _UNHASHABLE, ExpressionTuple, KwdPair, _value_leaf_types
+
+
+class TermArena:
+    """A compact store for large collections of expressions.
+
+    Instead of one `ExpressionTuple` (and one `tuple`) per node, an arena keeps
+    the structure of its expressions in flat integer arrays:
+
+    - ``_offsets[i]`` is the position of node ``i``'s first element (i.e. its
+      operator) in ``_children``,
+    - ``_lengths[i]`` is the number of elements in node ``i`` (i.e. its arity
+      plus one), and
+    - ``_children`` holds the element codes of all the nodes.
+
+    A non-negative code is the index of another node, and a negative code
+    ``-k - 1`` is the index ``k`` of an interned operator or leaf in
+    ``_leaves``.  Leaves are interned by identity, except for `int`s, `str`s
+    and the like, which are interned by value.  `KwdPair`s with
+    `ExpressionTuple` values are stored as a reference to the value and an
+    entry in ``_kwds``.  Codes are stored as 32-bit integers, so an arena
+    holds at most ``2**31`` nodes and leaves.
+
+    Nodes are accessed through `ArenaTerm` handles, which are
+    `ExpressionTuple`s, so evaluation, equality, `rator`/`rands` and the like
+    all work as usual.  Evaluated objects, hashes and sort keys are
+    cached in the arena.
+    """
+
+    def __init__(self):
+        self._leaves = []
+        self._leaf_index = {}
+        self._offsets = array("q")
+        self._lengths = array("i")
+        self._children = array("i")
+        self._kwds = {}
+        self._evaled = {}
+        self._hashes = {}
+        self._keys = {}
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def _leaf_code(self, x):
+        # The leaves are kept in `_leaves`, so their `id`s can't be reused
+        if type(x) in _value_leaf_types:
+            key = (type(x), x)
+        else:
+            key = id(x)
+
+        idx = self._leaf_index.get(key)
+
+        if idx is None:
+            idx = len(self._leaves)
+            self._leaves.append(x)
+            self._leaf_index[key] = idx
+
+        return -idx - 1
+
+    def _element(self, code):
+        if code < 0:
+            return self._leaves[-code - 1]
+        return self.term(code)
+
+    def add(self, x):
+        """Add an expression to the arena and return its `ArenaTerm` handle.
+
+        Sub-expressions that are shared (i.e. the same object) in `x` are
+        stored once, as are handles that already belong to this arena.
+        Evaluated objects and hashes cached in `x` are carried over.
+        """
+        if not isinstance(x, ExpressionTuple):
+            raise TypeError(f"Only ExpressionTuples can be added: {type(x)}")
+
+        if isinstance(x, ArenaTerm) and x._arena is self:
+            return x
+
+        # Map `id`s to `(object, node index)`; the objects are kept so that
+        # their `id`s can't be reused while we're building.
+        memo = {}
+        stack = [(x, None)]
+
+        while stack:
+            t, items = stack[-1]
+
+            if id(t) in memo:
+                stack.pop()
+                continue
+
+            if items is None:
+                items = t._tuple
+                stack[-1] = (t, items)
+                pending = False
+                for item in items:
+                    if isinstance(item, KwdPair):
+                        item = item.value
+                    if (
+                        isinstance(item, ExpressionTuple)
+                        and id(item) not in memo
+                        and not (isinstance(item, ArenaTerm) and item._arena is self)
+                    ):
+                        stack.append((item, None))
+                        pending = True
+                if pending:
+                    continue
+
+            stack.pop()
+
+            offset = len(self._children)
+            for pos, item in enumerate(items):
+                if isinstance(item, KwdPair) and isinstance(
+                    item.value, ExpressionTuple
+                ):
+                    self._kwds[offset + pos] = item.arg
+                    item = item.value
+
+                if isinstance(item, ArenaTerm) and item._arena is self:
+                    code = item._index
+                elif isinstance(item, ExpressionTuple):
+                    code = memo[id(item)][1]
+                else:
+                    code = self._leaf_code(item)
+
+                self._children.append(code)
+
+            idx = len(self._offsets)
+            self._offsets.append(offset)
+            self._lengths.append(len(items))
+
+            evaled_obj = t._evaled_obj
+            if evaled_obj is not ExpressionTuple.null:
+                self._evaled[idx] = evaled_obj
+            if t._hash is not None:
+                self._hashes[idx] = t._hash
+
+            memo[id(t)] = (t, idx)
+
+        return self.term(memo[id(x)][1])
+
+    def term(self, index):
+        """Return an `ArenaTerm` handle for the node at `index`."""
+        if not 0 <= index < len(self._offsets):
+            raise IndexError(f"No node {index} in the arena")
+
+        res = object.__new__(ArenaTerm)
+        res._arena = self
+        res._index = index
+        res._parent = None
+        res._eval_plan = None
+
+        if core._tracked_instances is not None:
+            core._track_instance(res)
+
+        return res
+
+    def postorder(self, index):
+        """Generate the indices of the nodes reachable from `index` in post-order.
+
+        Shared nodes are only generated once.  This only touches the arena's
+        arrays, so it's much cheaper than walking the equivalent
+        `ExpressionTuple`s.
+        """
+        offsets, lengths, children = self._offsets, self._lengths, self._children
+        seen = set()
+        stack = [(index, False)]
+
+        while stack:
+            idx, expanded = stack.pop()
+
+            if expanded:
+                yield idx
+                continue
+
+            if idx in seen:
+                continue
+
+            seen.add(idx)
+            stack.append((idx, True))
+
+            start = offsets[idx]
+            for pos in range(start + lengths[idx] - 1, start - 1, -1):
+                code = children[pos]
+                if code >= 0 and code not in seen:
+                    stack.append((code, False))
+
+
+class ArenaTerm(ExpressionTuple):
+    """An `ExpressionTuple` handle for a node in a `TermArena`.
+
+    Handles are created by `TermArena.add` and `TermArena.term`.  Their
+    elements are materialized from the arena when accessed, and operations
+    that construct new expressions (e.g. slicing and concatenation) produce
+    regular `ExpressionTuple`s.
+    """
+
+    __slots__ = ("_arena", "_index")
+
+    def __new__(cls, seq=None, **kwargs):
+        return ExpressionTuple(seq, **kwargs)
+
+    @classmethod
+    def from_tuple(cls, t, evaled_obj=ExpressionTuple.null):
+        return ExpressionTuple.from_tuple(t, evaled_obj)
+
+    @property
+    def _tuple(self):
+        arena = self._arena
+        start = arena._offsets[self._index]
+        end = start + arena._lengths[self._index]
+        kwds = arena._kwds
+
+        res = []
+        for pos in range(start, end):
+            item = arena._element(arena._children[pos])
+            if kwds and pos in kwds:
+                item = KwdPair(kwds[pos], item)
+            res.append(item)
+
+        return tuple(res)
+
+    @property
+    def _evaled_obj(self):
+        return self._arena._evaled.get(self._index, ExpressionTuple.null)
+
+    @_evaled_obj.setter
+    def _evaled_obj(self, obj):
+        self._arena._evaled[self._index] = obj
+
+    def __len__(self):
+        return self._arena._lengths[self._index]
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            arena = self._arena
+            length = arena._lengths[self._index]
+            if key < 0:
+                key += length
+            if not 0 <= key < length:
+                raise IndexError("tuple index out of range")
+            pos = arena._offsets[self._index] + key
+            item = arena._element(arena._children[pos])
+            if pos in arena._kwds:
+                item = KwdPair(arena._kwds[pos], item)
+            return item
+
+        return super().__getitem__(key)
+
+    def __eq__(self, other):
+        if (
+            isinstance(other, ArenaTerm)
+            and other._arena is self._arena
+            and other._index == self._index
+        ):
+            return True
+        return super().__eq__(other)
+
+    @property
+    def _hash(self):
+        return self._arena._hashes.get(self._index)
+
+    @_hash.setter
+    def _hash(self, value):
+        self._arena._hashes[self._index] = value
+
+    @property
+    def _key(self):
+        return self._arena._keys.get(self._index)
+
+    @_key.setter
+    def _key(self, value):
+        self._arena._keys[self._index] = value
+
+    def __hash__(self):
+        # Handles are created on access, so the hashes are computed bottom-up
+        # by node and cached in the arena
+        arena = self._arena
+        hashes = arena._hashes
+        res = hashes.get(self._index)
+
+        if res is None:
+            for idx in arena.postorder(self._index):
+                if idx not in hashes:
+                    # The elements' hashes have already been cached
+                    try:
+                        hashes[idx] = hash(arena.term(idx)._tuple)
+                    except TypeError:
+                        hashes[idx] = _UNHASHABLE
+            res = hashes[self._index]
+
+        if res is _UNHASHABLE:
+            raise TypeError(f"unhashable elements in {type(self).__name__}")
+
+        return res
@@ -1,8 +1,15 @@
 import inspect
+import io
+import re
 import reprlib
 import warnings
-from collections import deque
-from collections.abc import Generator, Sequence
+import weakref
+from collections import Counter, deque
+from collections.abc import Generator, Iterable, Sequence
+from functools import partial
+from itertools import count, repeat
+from numbers import Real
+from types import BuiltinFunctionType, ModuleType
 from typing import Callable
 
 from multipledispatch import dispatch
@@ -11,6 +18,54 @@ etuple_repr = reprlib.Repr()
 etuple_repr.maxstring = 100
 etuple_repr.maxother = 100
 
+# Map the `id`s of the `ExpressionTuple`s and `KwdPair`s created while instance
+# tracking is enabled (see `track_instances`) to weak references.  A `WeakSet`
+# can't be used, because it hashes its elements.
+_tracked_instances = None
+
+
+def _track_instance(x):
+    tracked = _tracked_instances
+    tracked[id(x)] = weakref.ref(x, lambda _, k=id(x): tracked.pop(k, None))
+
+
+def track_instances(enabled=True):
+    """Enable or disable the tracking of live `ExpressionTuple`s and `KwdPair`s.
+
+    Only instances created while tracking is enabled are tracked, and
+    disabling tracking forgets them.  See `live_instances`.
+    """
+    global _tracked_instances
+
+    if not enabled:
+        _tracked_instances = None
+    elif _tracked_instances is None:
+        _tracked_instances = {}
+
+
+def live_instances():
+    """Return a `Counter` of the types of the tracked instances that are alive.
+
+    This is useful for finding leaks in long-running processes, e.g. by
+    comparing the counts before and after some work.
+    """
+    if _tracked_instances is None:
+        return Counter()
+    instances = (ref() for ref in list(_tracked_instances.values()))
+    return Counter(type(x) for x in instances if x is not None)
+
+
+class _Null:
+    """The type of `ExpressionTuple.null`, which is pickled by reference."""
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        return "ExpressionTuple.null"
+
+    def __repr__(self):
+        return "ExpressionTuple.null"
+
 
 class IgnoredGenerator:
     __slots__ = ("gen",)
@@ -19,6 +74,65 @@ class IgnoredGenerator:
         self.gen = gen
 
 
+class GeneratorCache(Iterable):
+    """A replayable, lazily filled cache of a generator's results.
+
+    Each iteration over this object starts from the first result.  Results
+    are pulled from the underlying generator only when an iterator needs
+    them, and they're buffered so that other iterators can replay them.
+
+    When `maxlen` is given, only the last `maxlen` results are kept, so
+    memory use is bounded; iterators that fall behind the buffer raise a
+    `ValueError`.
+    """
+
+    __slots__ = ("_gen", "_buffer", "_count")
+
+    def __init__(self, gen, maxlen=None):
+        self._gen = gen
+        # Indexing into the middle of a `deque` takes linear time, so a `list`
+        # is used when all the results are kept
+        self._buffer = [] if maxlen is None else deque(maxlen=maxlen)
+        # The total number of results pulled from `_gen`
+        self._count = 0
+
+    @property
+    def maxlen(self):
+        if isinstance(self._buffer, list):
+            return None
+        return self._buffer.maxlen
+
+    def __iter__(self):
+        buffer = self._buffer
+        i = 0
+
+        while True:
+            start = self._count - len(buffer)
+
+            if i < start:
+                raise ValueError(
+                    f"Result {i} was discarded from the bounded generator cache"
+                )
+            elif i < self._count:
+                yield buffer[i - start]
+                i += 1
+                continue
+            elif self._gen is None:
+                return
+
+            try:
+                item = next(self._gen)
+            except StopIteration:
+                self._gen = None
+                return
+
+            buffer.append(item)
+            self._count += 1
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._gen!r}, maxlen={self.maxlen})"
+
+
 def trampoline_eval(z, res_filter=None):
     """Evaluate a stream of generators.
 
@@ -76,13 +190,16 @@ class KwdPair(object):
 
     """
 
-    __slots__ = ("arg", "value")
+    __slots__ = ("arg", "value", "__weakref__")
 
     def __init__(self, arg, value):
         assert isinstance(arg, str)
         self.arg = arg
         self.value = value
 
+        if _tracked_instances is not None:
+            _track_instance(self)
+
     def _eval_step(self):
         if isinstance(self.value, (ExpressionTuple, KwdPair)):
             value = yield self.value._eval_step()
@@ -95,7 +212,7 @@ class KwdPair(object):
         return f"{self.__class__.__name__}({repr(self.arg)}, {repr(self.value)})"
 
     def __str__(self):
-        return f"{self.arg}={self.value}"
+        return etuple_str(self)
 
     def _repr_pretty_(self, p, cycle):
         p.text(str(self))
@@ -120,11 +237,31 @@ class ExpressionTuple(Sequence):
     preserve the return value through limited forms of concatenation/cons-ing
     that would reproduce the parent expression.
 
-    TODO: Should probably use weakrefs for that.
+    When `ExpressionTuple.weak_parents` is enabled, slices only hold weak
+    references to their parents, so that they don't keep (possibly large)
+    parent expressions and their cached results alive; the parents are then
+    only reproduced while they're alive.
     """
 
-    __slots__ = ("_evaled_obj", "_tuple", "_parent")
-    null = object()
+    __slots__ = (
+        "_evaled_obj",
+        "_tuple",
+        "_parent",
+        "_hash",
+        "_key",
+        "_eval_plan",
+        "__weakref__",
+    )
+    null = _Null()
+
+    # When enabled, generators returned by operators are cached as
+    # `GeneratorCache`s (with `stream_maxlen` as their `maxlen`), so that
+    # their results can be replayed and consumed incrementally.
+    stream_generators = False
+    stream_maxlen = None
+
+    # When enabled, slices hold weak references to their parents
+    weak_parents = False
 
     def __new__(cls, seq=None, **kwargs):
         # XXX: This doesn't actually remove the entry from the kwargs
@@ -137,6 +274,9 @@ class ExpressionTuple(Sequence):
 
         res = super().__new__(cls)
 
+        if _tracked_instances is not None:
+            _track_instance(res)
+
         return res
 
     def __init__(self, seq=None, **kwargs):
@@ -159,6 +299,86 @@ class ExpressionTuple(Sequence):
         # TODO: Consider making these a weakrefs.
         self._evaled_obj = _evaled_obj
         self._parent = None
+        self._hash = None
+        self._key = None
+        self._eval_plan = None
+
+    @classmethod
+    def from_tuple(cls, t, evaled_obj=null):
+        """Create an expression tuple that uses `t` as its underlying `tuple`.
+
+        This is a trusted, low-overhead constructor: `t` must be a `tuple`
+        and is used as-is (i.e. it isn't copied and keyword arguments must
+        already be `KwdPair`s).  As with the ``evaled_obj`` keyword of the
+        regular constructor, `evaled_obj` is not checked.
+        """
+        res = object.__new__(cls)
+        res._tuple = t
+        res._evaled_obj = evaled_obj
+        res._parent = None
+        res._hash = None
+        res._key = None
+        res._eval_plan = None
+
+        if _tracked_instances is not None:
+            _track_instance(res)
+
+        return res
+
+    @classmethod
+    def from_postorder(cls, nodes):
+        """Build a DAG of expression tuples from a post-order list of nodes.
+
+        Each node is a triple ``(items, refs, evaled_obj)``, where ``items`` is
+        a `tuple` of the node's elements, ``refs`` is a sequence of
+        ``(position, node_index)`` pairs indicating which elements are
+        references to previously listed nodes, and ``evaled_obj`` is the
+        node's evaluated object (or `ExpressionTuple.null`).  When the element
+        at a reference's position is a `KwdPair`, the reference replaces its
+        value.
+
+        Nodes that are referenced more than once are shared in the results.
+
+        Returns
+        -------
+        A `list` of the `ExpressionTuple`s for each node; the last entry is the
+        root when `nodes` describes a single expression.
+        """
+        return _build_postorder(nodes, repeat(cls))
+
+    def to_postorder(self):
+        """Return a post-order list of nodes describing this expression tuple.
+
+        This is the inverse of `ExpressionTuple.from_postorder`: each
+        `ExpressionTuple` in the DAG (i.e. each distinct object) is listed once,
+        after the nodes it references, and the elements at reference positions
+        are replaced with ``None``.  The last node is this expression tuple.
+        """
+        return _to_postorder([self])[0]
+
+    def __reduce__(self):
+        # Pickle through the flat post-order form, so that deep expressions
+        # don't hit the recursion limit and shared sub-expressions stay
+        # shared.  The nodes' types and (strong) parent links are carried
+        # over, but cached hashes aren't.
+        nodes, _, objs = _to_postorder([self], parents=True)
+        index = {id(x): idx for idx, x in enumerate(objs)}
+        types = [type(x) for x in objs]
+        parents = [
+            (idx, index[id(x._parent)])
+            for idx, x in enumerate(objs)
+            if _strong_parent(x) is not None
+        ]
+        return (_from_postorder, (nodes, types, parents, index[id(self)]))
+
+    def __copy__(self):
+        # A shallow copy shares the elements, so the post-order form used by
+        # `__reduce__` (and `copy.deepcopy`) isn't needed
+        res = type(self).from_tuple(self._tuple, self._evaled_obj)
+        res._parent = self._parent
+        res._hash = self._hash
+        res._key = self._key
+        return res
 
     @property
     def evaled_obj(self):
@@ -195,9 +415,24 @@ class ExpressionTuple(Sequence):
             raise InvalidExpression("Empty expression.")
 
         if self._evaled_obj is not self.null:
-            yield self._evaled_obj
+            if isinstance(self._evaled_obj, Generator):
+                # Keep the trampoline from stepping through a cached generator
+                yield IgnoredGenerator(self._evaled_obj)
+            else:
+                yield self._evaled_obj
         else:
-            op = self._tuple[0]
+            t = self._tuple
+            op = t[0]
+
+            # Expression tuples are immutable, so the classification of their
+            # operands only needs to be done once.  It's only kept once an
+            # expression is evaluated again, since evaluations are cached.
+            steps = self._eval_plan
+            if steps is None:
+                steps = _eval_steps(t)
+                self._eval_plan = _EVALUATED
+            elif steps is _EVALUATED:
+                steps = self._eval_plan = _eval_steps(t)
 
             if isinstance(op, (ExpressionTuple, KwdPair)):
                 op = yield op._eval_step()
@@ -208,84 +443,109 @@ class ExpressionTuple(Sequence):
                 )
 
             evaled_args = []
-            evaled_kwargs = []
-            for i in self._tuple[1:]:
-                if isinstance(i, (ExpressionTuple, KwdPair)):
-                    i = yield i._eval_step()
-
-                if isinstance(i, KwdPair):
-                    evaled_kwargs.append(i)
+            evaled_kwargs = {}
+            for kind, x in steps:
+                if kind == _PLAN_ARG:
+                    evaled_args.append(x)
+                elif kind == _PLAN_TERM:
+                    i = yield t[x]._eval_step()
+                    if isinstance(i, KwdPair):
+                        evaled_kwargs[i.arg] = i.value
+                    else:
+                        evaled_args.append(i)
+                elif kind == _PLAN_KWD:
+                    evaled_kwargs[x[0]] = x[1]
                 else:
-                    evaled_args.append(i)
+                    value = yield t[x[1]].value._eval_step()
+                    evaled_kwargs[x[0]] = value
 
-            try:
-                op_sig = inspect.signature(self._eval_apply_fn(op))
-            except ValueError:
-                # This handles some builtin function types
-                _evaled_obj = op(*(evaled_args + [kw.value for kw in evaled_kwargs]))
+            fn = self._eval_apply_fn(op)
+            sig = _signature(fn)
+
+            if sig is None:
+                _evaled_obj = op(*evaled_args, *evaled_kwargs.values())
             else:
-                op_args = op_sig.bind(
-                    *evaled_args, **{kw.arg: kw.value for kw in evaled_kwargs}
-                )
+                op_args = sig.bind(*evaled_args, **evaled_kwargs)
                 op_args.apply_defaults()
 
-                _evaled_obj = self._eval_apply_fn(op)(*op_args.args, **op_args.kwargs)
+                _evaled_obj = fn(*op_args.args, **op_args.kwargs)
 
             if isinstance(_evaled_obj, Generator):
-                self._evaled_obj = _evaled_obj
-                yield IgnoredGenerator(_evaled_obj)
+                if self.stream_generators:
+                    self._evaled_obj = GeneratorCache(_evaled_obj, self.stream_maxlen)
+                    yield self._evaled_obj
+                else:
+                    self._evaled_obj = _evaled_obj
+                    yield IgnoredGenerator(_evaled_obj)
             else:
                 self._evaled_obj = _evaled_obj
                 yield self._evaled_obj
 
+    def _resolve_parent(self):
+        """Return the parent expression, or ``None`` if it's unset or dead."""
+        parent = self._parent
+        if isinstance(parent, weakref.ref):
+            return parent()
+        return parent
+
     def __add__(self, x):
         res = self._tuple + x
-        if self._parent is not None and res == self._parent._tuple:
-            return self._parent
+        parent = self._resolve_parent()
+        if parent is not None and res == parent._tuple:
+            return parent
         return type(self)(res)
 
     def __contains__(self, *args):
         return self._tuple.__contains__(*args)
 
-    def __ge__(self, *args):
-        return self._tuple.__ge__(*args)
+    def __ge__(self, other):
+        if isinstance(other, ExpressionTuple):
+            return _compare(self, other) >= 0
+        return self._tuple.__ge__(other)
 
     def __getitem__(self, key):
         tuple_res = self._tuple[key]
         if isinstance(key, slice) and isinstance(tuple_res, tuple):
-            tuple_res = type(self)(tuple_res)
-            tuple_res._parent = self
+            tuple_res = type(self).from_tuple(tuple_res)
+            tuple_res._parent = weakref.ref(self) if self.weak_parents else self
         return tuple_res
 
-    def __gt__(self, *args):
-        return self._tuple.__gt__(*args)
+    def __gt__(self, other):
+        if isinstance(other, ExpressionTuple):
+            return _compare(self, other) > 0
+        return self._tuple.__gt__(other)
 
     def __iter__(self, *args):
         return self._tuple.__iter__(*args)
 
-    def __le__(self, *args):
-        return self._tuple.__le__(*args)
+    def __le__(self, other):
+        if isinstance(other, ExpressionTuple):
+            return _compare(self, other) <= 0
+        return self._tuple.__le__(other)
 
     def __len__(self, *args):
         return self._tuple.__len__(*args)
 
-    def __lt__(self, *args):
-        return self._tuple.__lt__(*args)
+    def __lt__(self, other):
+        if isinstance(other, ExpressionTuple):
+            return _compare(self, other) < 0
+        return self._tuple.__lt__(other)
 
     def __mul__(self, *args):
-        return type(self)(self._tuple.__mul__(*args))
+        return type(self).from_tuple(self._tuple.__mul__(*args))
 
     def __rmul__(self, *args):
-        return type(self)(self._tuple.__rmul__(*args))
+        return type(self).from_tuple(self._tuple.__rmul__(*args))
 
     def __radd__(self, x):
         res = x + self._tuple  # type(self)(x + self._tuple)
-        if self._parent is not None and res == self._parent._tuple:
-            return self._parent
+        parent = self._resolve_parent()
+        if parent is not None and res == parent._tuple:
+            return parent
         return type(self)(res)
 
     def __str__(self):
-        return f"e({', '.join(tuple(str(i) for i in self._tuple))})"
+        return etuple_str(self)
 
     def __repr__(self):
         return f"ExpressionTuple({etuple_repr.repr(self._tuple)})"
@@ -293,14 +553,30 @@ class ExpressionTuple(Sequence):
     def _repr_pretty_(self, p, cycle):
         if cycle:
             p.text("e(...)")  # pragma: no cover
-        else:
-            with p.group(2, "e(", ")"):
+            return
+
+        # Nested `ExpressionTuple`s are expanded here, instead of through
+        # `p.pretty`, so that deep expressions don't hit the recursion limit.
+        stack = [(_PRETTY_ITEM, self)]
+
+        while stack:
+            kind, item = stack.pop()
+
+            if kind is _PRETTY_SEP:
+                p.text(",")
+                p.breakable()
+            elif kind is _PRETTY_CLOSE:
+                p.end_group(2, ")")
+            elif isinstance(item, ExpressionTuple):
+                p.begin_group(2, "e(")
                 p.breakable(sep="")
-                for idx, item in enumerate(self._tuple):
+                stack.append((_PRETTY_CLOSE, None))
+                for idx in range(len(item._tuple) - 1, -1, -1):
+                    stack.append((_PRETTY_ITEM, item._tuple[idx]))
                     if idx:
-                        p.text(",")
-                        p.breakable()
-                    p.pretty(item)
+                        stack.append((_PRETTY_SEP, None))
+            else:
+                p.pretty(item)
 
     def __eq__(self, other):
         # Built-in `==` won't work in CPython for deeply nested structures.
@@ -333,8 +609,742 @@ class ExpressionTuple(Sequence):
         return True
 
     def __hash__(self):
-        # XXX: CPython fails for deeply nested tuples!
-        return hash(self._tuple)
+        # CPython's `tuple` hash recurses and fails for deeply nested tuples, so
+        # we compute (and cache) the hashes of nested `ExpressionTuple`s
+        # bottom-up first.
+        res = self._hash
+        if res is None:
+            _cache_hashes(self)
+            res = self._hash
+        if res is _UNHASHABLE:
+            raise TypeError(f"unhashable elements in {type(self).__name__}")
+        return res
+
+
+# Equal values of these types are interchangeable, so leaves of them can be
+# merged by value; other leaves (e.g. ``0.0`` and ``-0.0``, or
+# ``Decimal("1")`` and ``Decimal("1.00")``) need to be merged by identity.
+_value_leaf_types = frozenset((int, bool, str, bytes, type(None)))
+
+
+def _strong_parent(x):
+    parent = x._parent
+    return None if isinstance(parent, weakref.ref) else parent
+
+
+def _to_postorder(roots, parents=False):
+    """Return the post-order nodes for the `ExpressionTuple`s in `roots`.
+
+    See `ExpressionTuple.to_postorder`.  The nodes are shared between the
+    roots, and the index of each root's node (``None`` for roots that aren't
+    `ExpressionTuple`s) and the `ExpressionTuple` for each node are also
+    returned.  When `parents` is true, the nodes of the (strongly referenced)
+    parents of the walked `ExpressionTuple`s are included too.
+    """
+    nodes = []
+    objs = []
+    # Map `id`s to `(object, node index)`; the objects are kept so that their
+    # `id`s can't be reused while we're walking (e.g. for temporary handles).
+    index = {}
+
+    def child_terms(t):
+        for i in t:
+            if isinstance(i, KwdPair):
+                i = i.value
+            if isinstance(i, ExpressionTuple) and id(i) not in index:
+                yield i
+
+    pending = list(roots)
+
+    # `pending` grows when parents are included
+    for root in pending:
+        if not isinstance(root, ExpressionTuple):
+            continue
+
+        stack = [(root, None)]
+
+        while stack:
+            x, t = stack.pop()
+
+            if id(x) in index:
+                continue
+
+            if t is None:
+                t = x._tuple
+                stack.append((x, t))
+                stack.extend((i, None) for i in reversed(tuple(child_terms(t))))
+                continue
+
+            items = list(t)
+            refs = []
+            for pos, item in enumerate(t):
+                if isinstance(item, KwdPair) and isinstance(
+                    item.value, ExpressionTuple
+                ):
+                    refs.append((pos, index[id(item.value)][1]))
+                    items[pos] = KwdPair(item.arg, None)
+                elif isinstance(item, ExpressionTuple):
+                    refs.append((pos, index[id(item)][1]))
+                    items[pos] = None
+
+            index[id(x)] = (x, len(nodes))
+            nodes.append((tuple(items), tuple(refs), x._evaled_obj))
+            objs.append(x)
+
+            if parents:
+                parent = _strong_parent(x)
+                if parent is not None and id(parent) not in index:
+                    pending.append(parent)
+
+    return (
+        nodes,
+        [index[id(r)][1] if isinstance(r, ExpressionTuple) else None for r in roots],
+        objs,
+    )
+
+
+def _build_postorder(nodes, types):
+    """Build the `ExpressionTuple`s for post-order `nodes` using `types`.
+
+    See `ExpressionTuple.from_postorder`.
+    """
+    res = []
+
+    for (items, refs, evaled_obj), cls in zip(nodes, types):
+        if refs:
+            items = list(items)
+            for pos, idx in refs:
+                item = items[pos]
+                if isinstance(item, KwdPair):
+                    items[pos] = KwdPair(item.arg, res[idx])
+                else:
+                    items[pos] = res[idx]
+            items = tuple(items)
+
+        res.append(cls.from_tuple(items, evaled_obj))
+
+    return res
+
+
+def _from_postorder(nodes, types, parents, root):
+    res = _build_postorder(nodes, types)
+    for idx, parent_idx in parents:
+        res[idx]._parent = res[parent_idx]
+    return res[root]
+
+
+# The cached hash of an `ExpressionTuple` that contains unhashable elements
+_UNHASHABLE = object()
+
+
+def _cache_hashes(x):
+    """Cache the hashes of `x` and the `ExpressionTuple`s nested within it.
+
+    The hashes are the same as the corresponding `tuple`s' hashes, but they're
+    computed without recursion.
+    """
+    stack = [(x, False)]
+
+    while stack:
+        x, expanded = stack.pop()
+
+        if x._hash is not None:
+            continue
+
+        if expanded:
+            try:
+                x._hash = hash(x._tuple)
+            except TypeError:
+                # Remember this, so that the elements aren't walked again
+                x._hash = _UNHASHABLE
+            continue
+
+        stack.append((x, True))
+
+        # Find the `ExpressionTuple`s in `x`, including those within `tuple`s
+        # and `KwdPair`s
+        items = [x._tuple]
+        while items:
+            for i in items.pop():
+                if isinstance(i, ExpressionTuple):
+                    if i._hash is None:
+                        stack.append((i, False))
+                elif isinstance(i, tuple):
+                    items.append(i)
+                elif isinstance(i, KwdPair):
+                    items.append((i.value,))
+
+
+_PLAN_ARG, _PLAN_TERM, _PLAN_KWD, _PLAN_KWD_TERM = range(4)
+
+# The `_eval_plan` of an `ExpressionTuple` that's been evaluated once
+_EVALUATED = object()
+
+
+def _eval_steps(t):
+    """Classify the operands of an `ExpressionTuple`'s elements `t`.
+
+    Returns a `tuple` of ``(kind, x)`` pairs for the operands, in order, where
+    ``x`` is a constant argument, the index of a sub-term, a keyword name and
+    constant value pair, or a keyword name and sub-term index pair.
+    """
+    steps = []
+
+    for idx in range(1, len(t)):
+        i = t[idx]
+        if isinstance(i, KwdPair):
+            if isinstance(i.value, (ExpressionTuple, KwdPair)):
+                steps.append((_PLAN_KWD_TERM, (i.arg, idx)))
+            else:
+                steps.append((_PLAN_KWD, (i.arg, i.value)))
+        elif isinstance(i, ExpressionTuple):
+            steps.append((_PLAN_TERM, idx))
+        else:
+            steps.append((_PLAN_ARG, i))
+
+    return tuple(steps)
+
+
+# Map callables to their signatures (or ``None`` when they don't have one), so
+# that they're shared by all the expressions that use them.  Module-level
+# builtins can't be weakly referenced, so they're kept in their own `dict`.
+_signatures = weakref.WeakKeyDictionary()
+_static_signatures = {}
+
+
+def _signature(fn):
+    """Return the signature of `fn`, or ``None`` if it doesn't have one."""
+    cache = _static_signatures if _is_static(fn) else _signatures
+
+    try:
+        return cache[fn]
+    except KeyError:
+        pass
+    except TypeError:
+        # `fn` can't be hashed or weakly referenced, so it isn't cached
+        cache = None
+
+    try:
+        sig = inspect.signature(fn)
+    except ValueError:
+        # This handles some builtin function types
+        sig = None
+
+    if cache is not None:
+        cache[fn] = sig
+
+    return sig
+
+
+# Elements are compared by tokens that are tagged by their first element, so
+# that tokens for different kinds of objects never need to be compared beyond
+# their tags.  `ExpressionTuple`s and `tuple`s sort before `KwdPair`s, which
+# sort before leaves.
+_KEY_SEQ, _KEY_KWD, _KEY_NONE, _KEY_NUMBER, _KEY_STR, _KEY_BYTES, _KEY_OTHER = range(7)
+_SEQ_TOKEN = (_KEY_SEQ,)
+_NAN_TOKEN = (_KEY_NUMBER, True, 0)
+
+# The tokens of small `ExpressionTuple`s are embedded in the tokens of the
+# `ExpressionTuple`s that contain them, so that they're compared in one go.
+# The limits keep those comparisons cheap and shallow.
+_KEY_MAX_SIZE = 256
+_KEY_MAX_HEIGHT = 8
+
+_address_re = re.compile(r" at 0x[0-9a-fA-F]+")
+
+# Map the tokens of leaves that are ordered by name to ``(reference, token)``
+# pairs for the live leaves that have them, where the tokens are extended with
+# a rank.  Distinct leaves that aren't equal get distinct ranks, so that their
+# tokens are distinct, too, and equal leaves share the same token object,
+# which makes comparing them cheap.
+_leaf_ranks = {}
+_next_leaf_rank = count()
+
+
+def _is_static(x):
+    # Module-level builtins can't be weakly referenced, but they live as long
+    # as their modules
+    return isinstance(x, BuiltinFunctionType) and (
+        x.__self__ is None or isinstance(x.__self__, ModuleType)
+    )
+
+
+def _drop_ranked_token(token, ref):
+    entries = _leaf_ranks.get(token)
+    if entries is not None:
+        entries[:] = [e for e in entries if e[0] is not ref]
+        if not entries:
+            del _leaf_ranks[token]
+
+
+def _ranked_token(x, token):
+    """Return `token` extended with the rank of `x`, or ``None`` if it can't be."""
+    # The entries are copied, because the references' callbacks change them
+    entries = tuple(_leaf_ranks.get(token, ()))
+    res = None
+
+    for ref, ranked in entries:
+        y = ref()
+        if y is x:
+            return ranked
+        if res is None and y is not None:
+            try:
+                if y == x:
+                    res = ranked
+            except (TypeError, ValueError):
+                pass
+
+    # Equal leaves share a rank, and the rank is kept while any of them are
+    # alive
+    try:
+        ref = weakref.ref(x, partial(_drop_ranked_token, token))
+    except TypeError:
+        if not _is_static(x):
+            return None
+        ref = repeat(x).__next__
+
+    if res is None:
+        res = token + (next(_next_leaf_rank),)
+
+    _leaf_ranks.setdefault(token, []).append((ref, res))
+    return res
+
+
+def _element_token(x):
+    """Return the comparison token for `x` and whether it's final.
+
+    Elements with equal final tokens are equal; others need to be checked.
+    """
+    if isinstance(x, ExpressionTuple):
+        _, _, size, height = x._key
+        if size is not None and height <= _KEY_MAX_HEIGHT:
+            return (_KEY_SEQ, x._key[0]), True
+        return _SEQ_TOKEN, False
+    if isinstance(x, tuple):
+        return _SEQ_TOKEN, False
+    if isinstance(x, KwdPair):
+        token, final = _element_token(x.value)
+        return (_KEY_KWD, x.arg, token), final
+    if x is None:
+        return (_KEY_NONE,), True
+    if isinstance(x, Real):
+        if x != x:
+            return _NAN_TOKEN, False
+        return (_KEY_NUMBER, x), True
+    if isinstance(x, str):
+        return (_KEY_STR, x), True
+    if isinstance(x, bytes):
+        return (_KEY_BYTES, x), True
+
+    name = getattr(x, "__qualname__", None)
+    if isinstance(name, str):
+        # Functions, classes and the like are ordered by name
+        name = f"{getattr(x, '__module__', None)}.{name}"
+    else:
+        # Memory addresses would make the order differ between runs
+        name = _address_re.sub("", repr(x))
+
+    token = (_KEY_OTHER, type(x).__module__, type(x).__qualname__, name)
+    ranked = _ranked_token(x, token)
+
+    if ranked is None:
+        return token, False
+    return ranked, True
+
+
+def _sequence_key(items):
+    """Return the comparison key for a sequence's elements.
+
+    The key is a `tuple` of the elements' tokens, the positions of the
+    elements whose tokens aren't final, and the size and height of the
+    sequence, where the size is ``None`` when the tokens aren't all final or
+    embed too many other tokens.
+    """
+    tokens = []
+    checks = []
+    size = len(items)
+    height = 1
+
+    for pos, i in enumerate(items):
+        token, final = _element_token(i)
+        tokens.append(token)
+
+        if not final:
+            checks.append(pos)
+            continue
+
+        while isinstance(i, KwdPair):
+            i = i.value
+        if isinstance(i, ExpressionTuple):
+            _, _, i_size, i_height = i._key
+            size += i_size
+            height = max(height, i_height + 1)
+
+    if checks or size > _KEY_MAX_SIZE:
+        size = None
+
+    return tuple(tokens), tuple(checks), size, height
+
+
+def _cache_keys(x):
+    """Cache the comparison keys of `x` and the `ExpressionTuple`s within it."""
+    stack = [(x, False)]
+
+    while stack:
+        x, expanded = stack.pop()
+
+        if x._key is not None:
+            continue
+
+        if expanded:
+            x._key = _sequence_key(x._tuple)
+            continue
+
+        stack.append((x, True))
+
+        for i in x._tuple:
+            while isinstance(i, KwdPair):
+                i = i.value
+            if isinstance(i, ExpressionTuple) and i._key is None:
+                stack.append((i, False))
+
+
+def _sequence_tokens(x):
+    """Return the elements of the sequence `x` and their comparison key."""
+    if isinstance(x, ExpressionTuple):
+        if x._key is None:
+            _cache_keys(x)
+        return x._tuple, x._key
+
+    for i in x:
+        while isinstance(i, KwdPair):
+            i = i.value
+        if isinstance(i, ExpressionTuple) and i._key is None:
+            _cache_keys(i)
+
+    return x, _sequence_key(x)
+
+
+def _is_seq_pair(x_token, y_token):
+    """Determine whether unequal tokens are for the same kind of sequences."""
+    while x_token[0] == y_token[0] == _KEY_KWD and x_token[1] == y_token[1]:
+        x_token, y_token = x_token[2], y_token[2]
+    return x_token[0] == y_token[0] == _KEY_SEQ
+
+
+def _compare_sequences(x, y):
+    """Start comparing the sequences `x` and `y`.
+
+    Returns their elements, the positions that still need to be checked (in
+    order), and the result of the comparison if those positions are equal.
+    """
+    x_items, (x_tokens, x_checks, _, _) = _sequence_tokens(x)
+    y_items, (y_tokens, y_checks, _, _) = _sequence_tokens(y)
+
+    if not x_checks and not y_checks:
+        res = (x_tokens > y_tokens) - (x_tokens < y_tokens)
+        return x_items, y_items, (), res
+
+    checks = []
+    res = None
+    for pos, (x_token, y_token) in enumerate(zip(x_tokens, y_tokens)):
+        if x_token == y_token:
+            if pos in x_checks and x_items[pos] is not y_items[pos]:
+                checks.append(pos)
+        elif _is_seq_pair(x_token, y_token):
+            # Sub-terms with tokens that aren't final on one side
+            checks.append(pos)
+        else:
+            res = -1 if x_token < y_token else 1
+            break
+
+    if res is None:
+        # Prefixes sort first
+        res = (len(x_tokens) > len(y_tokens)) - (len(x_tokens) < len(y_tokens))
+
+    return x_items, y_items, checks, res
+
+
+def _compare(x, y):
+    """Compare `x` and `y` in the order described by `canonical_key`.
+
+    Returns a negative number, zero or a positive number when `x` sorts
+    before, the same as, or after `y`.
+    """
+    if x is y:
+        return 0
+
+    if not (
+        isinstance(x, (ExpressionTuple, tuple))
+        and isinstance(y, (ExpressionTuple, tuple))
+    ):
+        x, y = (x,), (y,)
+
+    x_items, y_items, checks, res = _compare_sequences(x, y)
+
+    if not checks:
+        return res
+
+    # Map the `id`s of the pairs of sequences that are known to compare equal
+    # to the pairs; this keeps shared sub-terms from being compared more than
+    # once, and the pairs are kept so that their `id`s can't be reused (e.g.
+    # by temporary arena handles).
+    equal = {}
+    # Each frame is ``[x_items, y_items, checks, index, result, x, y]``
+    stack = [[x_items, y_items, checks, 0, res, x, y]]
+
+    while stack:
+        frame = stack[-1]
+        x_items, y_items, checks, idx, res, x, y = frame
+
+        if idx == len(checks):
+            if res:
+                return res
+            stack.pop()
+            equal[(id(x), id(y))] = (x, y)
+            continue
+
+        frame[3] = idx + 1
+        x, y = x_items[checks[idx]], y_items[checks[idx]]
+
+        # The tokens match, so both elements are the same kind of object
+        while isinstance(x, KwdPair):
+            x, y = x.value, y.value
+
+        if x is y or (id(x), id(y)) in equal:
+            continue
+
+        if isinstance(x, (ExpressionTuple, tuple)):
+            x_items, y_items, checks, res = _compare_sequences(x, y)
+            if checks:
+                stack.append([x_items, y_items, checks, 0, res, x, y])
+            elif res:
+                return res
+            else:
+                equal[(id(x), id(y))] = (x, y)
+            continue
+
+        try:
+            if x == y:
+                continue
+        except (TypeError, ValueError):
+            pass
+
+        # Distinct objects with the same token (e.g. two NaNs, or objects that
+        # can't be weakly referenced) are ordered by `id`
+        return -1 if id(x) < id(y) else 1
+
+    return 0
+
+
+class _FlatKey(tuple):
+    """A canonical key made of final tokens, which is compared as a `tuple`."""
+
+    def __repr__(self):
+        return f"canonical_key({self.obj!r})"
+
+
+class _CanonicalKey(_FlatKey):
+    """A canonical key that's compared by walking the expressions.
+
+    See `canonical_key`.
+    """
+
+    def __eq__(self, other):
+        if not isinstance(other, _FlatKey):
+            return NotImplemented
+        return _compare(self.obj, other.obj) == 0
+
+    def __ne__(self, other):
+        if not isinstance(other, _FlatKey):
+            return NotImplemented
+        return _compare(self.obj, other.obj) != 0
+
+    def __lt__(self, other):
+        if not isinstance(other, _FlatKey):
+            return NotImplemented
+        return _compare(self.obj, other.obj) < 0
+
+    def __le__(self, other):
+        if not isinstance(other, _FlatKey):
+            return NotImplemented
+        return _compare(self.obj, other.obj) <= 0
+
+    def __gt__(self, other):
+        if not isinstance(other, _FlatKey):
+            return NotImplemented
+        return _compare(self.obj, other.obj) > 0
+
+    def __ge__(self, other):
+        if not isinstance(other, _FlatKey):
+            return NotImplemented
+        return _compare(self.obj, other.obj) >= 0
+
+    __hash__ = None
+
+
+def canonical_key(x):
+    """Return a sort key for `x` that totally orders expressions.
+
+    `ExpressionTuple`s and `tuple`s are ordered like `tuple`s (i.e.
+    element-wise, with prefixes first), numbers (with NaNs last) and `str`s by
+    value, and any other objects (e.g. operators) by type and then by
+    qualified name or, when they don't have one, `repr` (without memory
+    addresses).  Objects of different kinds are ordered by kind.
+
+    Distinct objects that aren't equal but would otherwise be tied (e.g. two
+    ``lambda``s, or two objects with the same `repr`) are ordered by when
+    they were first compared or, when they can't be weakly referenced, by
+    `id`, so their order is only consistent within a single process.
+
+    The comparison tokens of each `ExpressionTuple`'s elements are cached on
+    it, and the tokens of small sub-terms are embedded in them, so the keys
+    of most expressions are plain `tuple`s and repeatedly sorting them is
+    cheap.  Other keys (e.g. for expressions containing NaNs, or large ones)
+    are compared without recursion by walking both expressions, and
+    sub-terms that are shared (i.e. the same object) are only compared once,
+    so expressions with many shared sub-terms are compared in time
+    proportional to their number of distinct sub-terms.
+    """
+    if isinstance(x, ExpressionTuple):
+        if x._key is None:
+            _cache_keys(x)
+        tokens, checks, _, _ = x._key
+        if not checks:
+            # The tokens are compared directly
+            res = _FlatKey(tokens)
+            res.obj = x
+            return res
+
+    res = _CanonicalKey()
+    res.obj = x
+    return res
+
+
+_PRETTY_ITEM, _PRETTY_SEP, _PRETTY_CLOSE = object(), object(), object()
+
+
+def _shared_subterms(x):
+    """Return the ids of the `ExpressionTuple`s that appear more than once in `x`."""
+    seen = set()
+    shared = set()
+    stack = [x]
+
+    while stack:
+        x = stack.pop()
+
+        if isinstance(x, KwdPair):
+            stack.append(x.value)
+        elif isinstance(x, ExpressionTuple):
+            if id(x) in seen:
+                shared.add(id(x))
+            else:
+                seen.add(id(x))
+                stack.extend(x._tuple)
+
+    return shared
+
+
+def _str_tokens(x, max_depth=None, max_width=None, shared=None):
+    """Generate the pieces of the string form of `x` without recursion.
+
+    The stack holds either literal `str` tokens or ``(obj, depth)`` pairs that
+    still need to be rendered.
+    """
+    labels = {}
+    stack = [(x, 0)]
+
+    while stack:
+        item = stack.pop()
+
+        if isinstance(item, str):
+            yield item
+            continue
+
+        x, depth = item
+
+        if isinstance(x, KwdPair):
+            yield f"{x.arg}="
+            stack.append((x.value, depth))
+            continue
+        elif not isinstance(x, ExpressionTuple):
+            yield str(x)
+            continue
+
+        if shared and id(x) in shared:
+            label = labels.get(id(x))
+
+            if label is not None:
+                yield f"#{label}#"
+                continue
+
+            label = labels[id(x)] = len(labels) + 1
+            yield f"#{label}="
+
+        elems = x._tuple
+
+        if max_depth is not None and depth >= max_depth and elems:
+            yield "e(...)"
+            continue
+
+        yield "e("
+        stack.append(")")
+
+        if max_width is not None and len(elems) > max_width:
+            elems = elems[:max_width]
+            stack.append(", ..." if elems else "...")
+
+        for idx in range(len(elems) - 1, -1, -1):
+            stack.append((elems[idx], depth + 1))
+            if idx:
+                stack.append(", ")
+
+
+def etuple_str(
+    x, file=None, max_depth=None, max_width=None, max_length=None, share=False
+):
+    """Render the string form of an `ExpressionTuple` without recursion.
+
+    This produces the same output as ``str(x)`` (e.g. ``e(add, 1, e(mul, 2, 3))``),
+    but it can stream the output to a file-like object and bound its size.
+
+    Parameters
+    ----------
+    x: object
+        The object to render.  Nested `ExpressionTuple`s and `KwdPair`s are
+        expanded; everything else is rendered with `str`.
+    file: file-like, optional
+        If given, the output is written to ``file`` piece by piece and ``None``
+        is returned.  Otherwise, the output is returned as a `str`.
+    max_depth: int, optional
+        Nesting depth beyond which sub-expressions are elided as ``e(...)``.
+    max_width: int, optional
+        Number of elements rendered per expression; the rest are elided as
+        ``...``.
+    max_length: int, optional
+        Total number of characters to output before truncating with ``...``.
+    share: bool
+        Render `ExpressionTuple`s that appear more than once in `x` (i.e. shared
+        DAG nodes) once, labeled as ``#n=e(...)``, and refer to them with
+        ``#n#`` afterward.
+
+    """
+    out = io.StringIO() if file is None else file
+    shared = _shared_subterms(x) if share else None
+    remaining = max_length
+
+    for token in _str_tokens(x, max_depth, max_width, shared):
+        if remaining is not None:
+            if len(token) > remaining:
+                out.write(token[:remaining])
+                out.write("...")
+                break
+            remaining -= len(token)
+
+        out.write(token)
+
+    if file is None:
+        return out.getvalue()
 
 
 @dispatch([object])
@@ -1,24 +1,123 @@
 from collections.abc import Callable, Mapping, Sequence
+from itertools import islice, repeat
 
 from cons.core import ConsError, ConsNull, ConsPair, car, cdr, cons
 from multipledispatch import dispatch
 
-from .core import ExpressionTuple, KwdPair, etuple, trampoline_eval
+from .core import ExpressionTuple, KwdPair, _to_postorder, etuple, trampoline_eval
 
 try:  # noqa: C901
-    import unification
-    from packaging import version
-
-    if version.parse(unification.__version__) < version.parse("0.4.0"):
-        raise ModuleNotFoundError()
-
-    from unification.core import _reify, _unify, construction_sentinel, isvar
-except ModuleNotFoundError:
+    # `construction_sentinel` was introduced in `unification` 0.4.0, so this
+    # also serves as a version check without importing `packaging`.
+    from unification.core import (
+        Var,
+        _reify,
+        _unify,
+        assoc,
+        construction_sentinel,
+        isvar,
+        walk,
+    )
+except ImportError:  # pragma: no cover
     pass
 else:
 
+    _unify_object = _unify.dispatch(object, object, Mapping)
+    _unify_Var = _unify.dispatch(Var, object, Mapping)
+    _reify_object = _reify.dispatch(object, Mapping)
+    _reify_Var = _reify.dispatch(Var, Mapping)
+
+    # Map dispatchers to their `ordering` and a cache of the implementations
+    # they dispatch to by type signature
+    _dispatch_caches = {}
+
+    def _dispatches_to(dispatcher, types, func):
+        """Determine whether or not `dispatcher` calls `func` for `types`."""
+        # A dispatcher's `ordering` is recomputed when implementations are
+        # added, so it tells us when our cache is stale.
+        ordering = dispatcher.ordering
+        cache = _dispatch_caches.get(dispatcher)
+        if cache is None or cache[0] is not ordering:
+            cache = _dispatch_caches[dispatcher] = (ordering, {})
+
+        res = cache[1].get(types)
+        if res is None:
+            res = cache[1][types] = dispatcher.dispatch(*types)
+        return res is func
+
+    def _equal(x, y):
+        try:
+            return bool(x == y)
+        except (TypeError, ValueError):
+            return False
+
+    def _isvar(x):
+        # `isvar` hashes its argument, which isn't necessary for
+        # `ExpressionTuple`s (and can be expensive for new ones)
+        return not isinstance(x, ExpressionTuple) and isvar(x)
+
     def _unify_ExpressionTuple(u, v, s):
-        yield _unify(getattr(u, "_tuple", u), getattr(v, "_tuple", v), s)
+        # Nested `ExpressionTuple`s (and `tuple`s) are unified element-wise
+        # using one stack, instead of dispatching on every node.  Elements that
+        # can only be compared with `==` aren't dispatched on either, and
+        # neither are logic variables (when they use the standard
+        # implementation).
+        stack = [(u, v)]
+
+        while stack:
+            u, v = stack.pop()
+
+            if u is v:
+                continue
+
+            if isinstance(u, (ExpressionTuple, tuple)) and isinstance(
+                v, (ExpressionTuple, tuple)
+            ):
+                u_t = u._tuple if isinstance(u, ExpressionTuple) else u
+                v_t = v._tuple if isinstance(v, ExpressionTuple) else v
+
+                if len(u_t) != len(v_t):
+                    yield False
+                    return
+
+                # The operators are at the top of the stack, so they're
+                # unified before the operands are descended into
+                stack.extend(zip(reversed(u_t), reversed(v_t)))
+            elif isinstance(u, KwdPair) and isinstance(v, KwdPair):
+                if u.arg != v.arg:
+                    yield False
+                    return
+
+                stack.append((u.value, v.value))
+            elif _isvar(u) or _isvar(v):
+                if not _dispatches_to(_unify, (type(u), type(v), type(s)), _unify_Var):
+                    s = yield _unify(u, v, s)
+                    if s is False:
+                        return
+                    continue
+
+                u_w = walk(u, s) if _isvar(u) else u
+                v_w = walk(v, s) if _isvar(v) else v
+
+                if u_w is v_w or u_w == v_w:
+                    continue
+                elif _isvar(u_w):
+                    s = assoc(s, u_w, v_w)
+                elif _isvar(v_w):
+                    s = assoc(s, v_w, u_w)
+                else:
+                    stack.append((u_w, v_w))
+            elif _dispatches_to(_unify, (type(u), type(v), type(s)), _unify_object):
+                if not u == v:
+                    yield False
+                    return
+            else:
+                s = yield _unify(u, v, s)
+
+                if s is False:
+                    return
+
+        yield s
 
     _unify.add((ExpressionTuple, ExpressionTuple, Mapping), _unify_ExpressionTuple)
     _unify.add((tuple, ExpressionTuple, Mapping), _unify_ExpressionTuple)
@@ -34,29 +133,89 @@ else:
 
     def _reify_ExpressionTuple(u, s):
         # The point of all this: we don't want to lose the expression
-        # tracking/caching information.
-        res = yield _reify(u._tuple, s)
-
-        yield construction_sentinel
+        # tracking/caching information, so nodes that don't change are
+        # returned as-is.  Nested `ExpressionTuple`s are reified bottom-up
+        # using one stack, and shared ones are only reified once.
+
+        # Map `id`s to `(node, reified node)`; the nodes are kept so that their
+        # `id`s can't be reused while we're walking.
+        memo = {}
+        stack = [(u, None)]
+
+        while stack:
+            x, t = stack.pop()
+
+            if id(x) in memo:
+                continue
+
+            if t is None:
+                # `_tuple` is only read once per node, because it can produce
+                # new elements on every read (e.g. for arena handles)
+                t = x._tuple
+                stack.append((x, t))
+                for i in t:
+                    if isinstance(i, KwdPair):
+                        i = i.value
+                    if isinstance(i, ExpressionTuple) and id(i) not in memo:
+                        stack.append((i, None))
+                continue
+
+            res = []
+            changed = False
+            # Whether or not only logic variables were changed
+            vars_only = True
+
+            for i in t:
+                kwd = None
+                if isinstance(i, KwdPair):
+                    kwd, i = i, i.value
+
+                if isinstance(i, ExpressionTuple):
+                    r = memo[id(i)][1]
+                elif _dispatches_to(_reify, (type(i), type(s)), _reify_object):
+                    r = i
+                elif _isvar(i) and _dispatches_to(
+                    _reify, (type(i), type(s)), _reify_Var
+                ):
+                    r = walk(i, s)
+                    if _isvar(r):
+                        # This lets stream filters (e.g. in `isground`) see
+                        # unground logic variables
+                        r = yield r
+                    elif r is not i and (
+                        isinstance(r, ExpressionTuple)
+                        or not _dispatches_to(_reify, (type(r), type(s)), _reify_object)
+                    ):
+                        r = yield _reify(r, s)
+                else:
+                    r = yield _reify(i, s)
+                    if r is not i and _equal(r, i):
+                        # E.g. a `tuple` without logic variables was rebuilt
+                        r = i
+
+                if r is not i:
+                    changed = True
+                    vars_only = vars_only and _isvar(i)
+                    if kwd is not None:
+                        kwd = KwdPair(kwd.arg, r)
+
+                res.append(r if kwd is None else kwd)
+
+            if not changed:
+                new = x
+            else:
+                new = type(x).from_tuple(tuple(res))
 
-        res_same = tuple(
-            a == b for a, b in zip(u, res) if not isvar(a) and not isvar(b)
-        )
+                if vars_only and x._resolve_parent() is not None:
+                    # If we simply swapped-out logic variables, then we don't
+                    # want to lose the parent etuple information.
+                    new._parent = x._parent
 
-        if len(res_same) == len(u) and all(res_same):
-            # Everything is equal and there are no logic variables
-            yield u
-            return
+            memo[id(x)] = (x, new)
 
-        if getattr(u, "_parent", None) and all(res_same):
-            # If we simply swapped-out logic variables, then we don't want to
-            # lose the parent etuple information.
-            res = type(u)(res)
-            res._parent = u._parent
-            yield res
-            return
+        yield construction_sentinel
 
-        yield type(u)(res)
+        yield memo[id(u)][1]
 
     _reify.add((ExpressionTuple, Mapping), _reify_ExpressionTuple)
 
@@ -114,6 +273,7 @@ def etuplize(
     convert_ConsPairs=True,
     rator_transform_fn=lambda x: x,
     rands_transform_fn=lambda x: x,
+    memo=None,
 ):
     r"""Return an expression-tuple for an object (i.e. a tuple of rand and rators).
 
@@ -136,6 +296,11 @@ def etuplize(
         the function is not applied to existing `ExpressionTuple`\s.
     rands_transform_fn: callable
         The same as `rator_transform_fn`, but for rands/CDR elements.
+    memo: dict, optional
+        A `dict` in which the conversions of (sub-)objects are cached by
+        `id`, so that objects shared between or within the converted objects
+        are only converted once and share their `ExpressionTuple`s.  The same
+        `dict` should only be used with the same options.
 
     """
 
@@ -151,11 +316,9 @@ def etuplize(
         elif (
             convert_ConsPairs and x is not None and isinstance(x, (ConsNull, ConsPair))
         ):
-            yield etuple(
-                *(
-                    (rator_transform_fn(rator(x)),)
-                    + tuple(rands_transform_fn(e) for e in rands(x))
-                )
+            yield ExpressionTuple.from_tuple(
+                (rator_transform_fn(rator(x)),)
+                + tuple(rands_transform_fn(e) for e in rands(x))
             )
             return
 
@@ -172,20 +335,109 @@ def etuplize(
                 raise TypeError(f"x is neither a non-str Sequence nor term: {type(x)}")
 
         op = rator_transform_fn(op)
-        args = etuple(*tuple(rands_transform_fn(a) for a in args))
+        args = tuple(rands_transform_fn(a) for a in args)
 
         if shallow:
             et_op = op
             et_args = args
         else:
-            et_op = yield etuplize_step(op, return_bad_args=True)
+            et_op = yield step(op, return_bad_args=True)
             et_args = []
             for a in args:
-                e = yield etuplize_step(
-                    a, return_bad_args=True, convert_ConsPairs=False
-                )
+                e = yield step(a, return_bad_args=True, convert_ConsPairs=False)
                 et_args.append(e)
 
-        yield etuplize_fn(op)(et_op, *et_args, evaled_obj=x)
+        etuple_ctor = etuplize_fn(op)
+
+        if etuple_ctor is etuple:
+            yield ExpressionTuple.from_tuple((et_op, *et_args), evaled_obj=x)
+        else:
+            yield etuple_ctor(et_op, *et_args, evaled_obj=x)
+
+    def memo_etuplize_step(
+        x,
+        shallow=shallow,
+        return_bad_args=return_bad_args,
+        convert_ConsPairs=convert_ConsPairs,
+    ):
+        # The options are part of the key, because they change the results
+        # (e.g. operators are converted with ``return_bad_args=True``)
+        key = (id(x), shallow, return_bad_args, convert_ConsPairs)
+        res = memo.get(key)
+
+        if res is not None:
+            yield res[1]
+            return
+
+        res = yield etuplize_step(
+            x,
+            shallow=shallow,
+            return_bad_args=return_bad_args,
+            convert_ConsPairs=convert_ConsPairs,
+        )
+        # `x` is kept so that its `id` can't be reused
+        memo[key] = (x, res)
+        yield res
+
+    step = etuplize_step if memo is None else memo_etuplize_step
 
-    return trampoline_eval(etuplize_step(x))
+    return trampoline_eval(step(x))
+
+
+def _etuplize_chunk(objs, kwargs):
+    memo = {}
+    res = [etuplize(x, memo=memo, **kwargs) for x in objs]
+    # Return the results in the compact post-order form, which is much cheaper
+    # to pickle than nested `ExpressionTuple`s and keeps shared sub-expressions
+    # shared between the results.
+    nodes, roots, _ = _to_postorder(res)
+    return nodes, [(idx, x if idx is None else None) for idx, x in zip(roots, res)]
+
+
+def etuplize_many(objs, executor=None, chunksize=256, **kwargs):
+    """Apply `etuplize` to each object in `objs`.
+
+    The objects are converted in chunks of `chunksize` objects, and each
+    chunk uses its own `etuplize` ``memo``, so that objects shared within a
+    chunk are only converted once.  The chunks are converted in parallel when
+    an `executor` (e.g. a `concurrent.futures.ProcessPoolExecutor`) is given.
+
+    Parameters
+    ----------
+    objs: iterable
+        The objects to convert.
+    executor: concurrent.futures.Executor, optional
+        The executor used to convert the chunks.  With a process pool, the
+        objects, their conversions and any `kwargs` (e.g. the transform
+        functions) must be picklable.
+    chunksize: int
+        The number of objects converted per task.
+    kwargs
+        Keyword arguments for `etuplize`.
+
+    Returns
+    -------
+    A `list` of the converted objects, in the order of `objs`.
+    """
+    if chunksize < 1:
+        raise ValueError("chunksize must be positive")
+
+    if executor is None:
+        res = []
+        objs = iter(objs)
+        while True:
+            chunk = list(islice(objs, chunksize))
+            if not chunk:
+                return res
+            memo = {}
+            res.extend(etuplize(x, memo=memo, **kwargs) for x in chunk)
+
+    objs = list(objs)
+    chunks = (objs[i : i + chunksize] for i in range(0, len(objs), chunksize))
+
+    res = []
+    for nodes, roots in executor.map(_etuplize_chunk, chunks, repeat(kwargs)):
+        ets = ExpressionTuple.from_postorder(nodes)
+        res.extend(x if idx is None else ets[idx] for idx, x in roots)
+
+    return res
@@ -0,0 +1,381 @@
+from unification.variable import isvar
+
+from .core import ExpressionTuple, KwdPair, _value_leaf_types
+
+
+def ast_size(op, arg_costs):
+    """Return the number of nodes in an expression (excluding operators)."""
+    return 1 + sum(arg_costs)
+
+
+class EGraph:
+    """An e-graph for `ExpressionTuple`s.
+
+    An e-graph compactly represents a set of expressions and equivalences
+    between their sub-expressions.  Expressions are added to an e-graph as
+    e-nodes, which are grouped into equivalence classes (e-classes) identified
+    by integer ids.  An e-node is a `tuple` of the e-class ids of an
+    expression's elements (i.e. its operator followed by its operands), so that
+    e-nodes are hash-consed by operator and arity, and every leaf (e.g. an
+    operator or a constant) gets its own e-class.  `KwdPair`s are treated as
+    leaves.  Leaves are merged by value when equal values of them are
+    interchangeable (e.g. `int`s and `str`s), and by identity otherwise (e.g.
+    ``0.0`` and ``-0.0`` are kept apart).
+
+    Rewrite rules are pairs of `ExpressionTuple` patterns, in which
+    `unification` logic variables match any e-class.  `EGraph.saturate`
+    applies all the rules in batches until no new equivalences are found, and
+    `EGraph.extract` returns the best `ExpressionTuple` in an e-class.
+
+    Example
+    -------
+    >>> from operator import add, mul
+    >>> from unification import var
+    >>> from etuples import etuple
+    >>> x = var()
+    >>> eg = EGraph()
+    >>> cid = eg.add(etuple(add, etuple(mul, "a", 1), 0))
+    >>> _ = eg.saturate([(etuple(mul, x, 1), x), (etuple(add, x, 0), x)])
+    >>> eg.extract(cid)
+    'a'
+
+    """
+
+    def __init__(self):
+        # Union-find parent links for the e-class ids
+        self._parents = []
+        # Canonical e-class id -> e-nodes and leaves in the e-class
+        self._nodes = {}
+        self._leaves = {}
+        # Canonical e-node -> e-class id
+        self._hashcons = {}
+        # Leaf key -> e-class id
+        self._leaf_classes = {}
+        # Whether or not the hash-cons needs to be rebuilt
+        self._dirty = False
+        self._num_nodes = 0
+
+    def __len__(self):
+        """Return the number of e-classes."""
+        return len(self._nodes)
+
+    @property
+    def num_nodes(self):
+        """Return the number of e-nodes (including leaves)."""
+        return self._num_nodes
+
+    def classes(self):
+        """Return the canonical e-class ids."""
+        return list(self._nodes)
+
+    def find(self, cid):
+        """Return the canonical id of the e-class `cid`."""
+        parents = self._parents
+        while parents[cid] != cid:
+            parents[cid] = parents[parents[cid]]
+            cid = parents[cid]
+        return cid
+
+    def _new_class(self):
+        cid = len(self._parents)
+        self._parents.append(cid)
+        self._nodes[cid] = []
+        self._leaves[cid] = []
+        return cid
+
+    @staticmethod
+    def _leaf_key(x):
+        # Leaves are only merged by value when equal values are
+        # interchangeable (e.g. not ``0.0`` and ``-0.0``).  The leaves are
+        # kept in `_leaves`, so their `id`s can't be reused.
+        if type(x) in _value_leaf_types:
+            return (type(x), x)
+        if type(x) is KwdPair:
+            return (KwdPair, x.arg, EGraph._leaf_key(x.value))
+        return (type(x), id(x))
+
+    def _add_leaf(self, x):
+        key = self._leaf_key(x)
+        cid = self._leaf_classes.get(key)
+
+        if cid is None:
+            cid = self._new_class()
+            self._leaves[cid].append(x)
+            self._num_nodes += 1
+            self._leaf_classes[key] = cid
+            return cid
+
+        return self.find(cid)
+
+    def _add_node(self, node):
+        node = tuple(self.find(c) for c in node)
+        cid = self._hashcons.get(node)
+
+        if cid is None:
+            cid = self._new_class()
+            self._nodes[cid].append(node)
+            self._num_nodes += 1
+            self._hashcons[node] = cid
+            return cid
+
+        return self.find(cid)
+
+    def _add(self, term, subst=None):
+        # `isvar` hashes its argument, so `ExpressionTuple`s are checked first
+        if not isinstance(term, ExpressionTuple):
+            if subst is not None and isvar(term):
+                return subst[term]
+            return self._add_leaf(term)
+
+        # Map `id`s to `(object, e-class id)`; the objects are kept so that
+        # their `id`s can't be reused while we're adding.
+        memo = {}
+        stack = [(term, False)]
+
+        while stack:
+            t, expanded = stack.pop()
+
+            if id(t) in memo:
+                continue
+
+            if not expanded:
+                stack.append((t, True))
+                stack.extend(
+                    (i, False)
+                    for i in t
+                    if isinstance(i, ExpressionTuple) and id(i) not in memo
+                )
+                continue
+
+            node = []
+            for i in t:
+                if isinstance(i, ExpressionTuple):
+                    node.append(memo[id(i)][1])
+                elif subst is not None and isvar(i):
+                    node.append(subst[i])
+                else:
+                    node.append(self._add_leaf(i))
+
+            memo[id(t)] = (t, self._add_node(node))
+
+        return memo[id(term)][1]
+
+    def add(self, term):
+        """Add an expression to the e-graph and return its e-class id."""
+        return self._add(term)
+
+    def union(self, a, b):
+        """Merge the e-classes `a` and `b` and return the resulting e-class id.
+
+        `EGraph.rebuild` must be called before the e-graph is queried again.
+        """
+        a, b = self.find(a), self.find(b)
+
+        if a == b:
+            return a
+
+        if len(self._nodes[a]) < len(self._nodes[b]):
+            a, b = b, a
+
+        self._parents[b] = a
+        self._nodes[a].extend(self._nodes.pop(b))
+        self._leaves[a].extend(self._leaves.pop(b))
+        self._dirty = True
+
+        return a
+
+    def rebuild(self):
+        """Restore the e-graph's invariants after calls to `EGraph.union`.
+
+        E-nodes are re-canonicalized, and e-classes containing the same e-node
+        (i.e. congruent expressions) are merged until nothing changes.
+        """
+        while self._dirty:
+            self._dirty = False
+            hashcons = {}
+
+            for cid in list(self._nodes):
+                if cid not in self._nodes:
+                    # It was merged into another e-class during this pass
+                    continue
+
+                nodes = list(
+                    dict.fromkeys(tuple(map(self.find, n)) for n in self._nodes[cid])
+                )
+                self._num_nodes -= len(self._nodes[cid]) - len(nodes)
+                self._nodes[cid] = nodes
+
+                for node in list(nodes):
+                    other = hashcons.get(node)
+                    if other is None:
+                        hashcons[node] = cid
+                    elif self.find(other) != self.find(cid):
+                        # Congruent e-nodes in different e-classes
+                        self.union(other, cid)
+
+            self._hashcons = hashcons
+
+    def _match(self, pattern, cid, subst):
+        cid = self.find(cid)
+
+        if isinstance(pattern, ExpressionTuple):
+            n = len(pattern)
+            for node in self._nodes[cid]:
+                if len(node) == n:
+                    yield from self._match_elements(pattern, node, 0, subst)
+        elif isvar(pattern):
+            bound = subst.get(pattern)
+            if bound is None:
+                subst = dict(subst)
+                subst[pattern] = cid
+                yield subst
+            elif self.find(bound) == cid:
+                yield subst
+        else:
+            leaf_cid = self._leaf_classes.get(self._leaf_key(pattern))
+            if leaf_cid is not None and self.find(leaf_cid) == cid:
+                yield subst
+
+    def _match_elements(self, pattern, node, i, subst):
+        if i == len(node):
+            yield subst
+            return
+
+        for s in self._match(pattern[i], node[i], subst):
+            yield from self._match_elements(pattern, node, i + 1, s)
+
+    def ematch(self, pattern, cid=None):
+        """Match a pattern against the e-graph.
+
+        Returns a `list` of ``(cid, subst)`` pairs, where ``subst`` maps the
+        logic variables in `pattern` to e-class ids.  If `cid` is given, only
+        that e-class is matched.
+        """
+        cids = self.classes() if cid is None else [self.find(cid)]
+        return [(c, s) for c in cids for s in self._match(pattern, c, {})]
+
+    def saturate(self, rules, max_iters=30, max_nodes=None):
+        """Apply rewrite rules until no new equivalences are found.
+
+        Each iteration finds all the matches for all the `rules`, then adds
+        the instantiated replacements, merges them with the matched e-classes
+        and rebuilds the e-graph.
+
+        Parameters
+        ----------
+        rules: sequence of pairs
+            ``(pattern, replacement)`` pairs of `ExpressionTuple`s (or logic
+            variables).  All the logic variables in a replacement must appear in
+            its pattern.
+        max_iters: int
+            The maximum number of iterations.
+        max_nodes: int, optional
+            Stop once the e-graph has more than this many e-nodes.
+
+        Returns
+        -------
+        The number of iterations that changed the e-graph.
+        """
+        for i in range(max_iters):
+            matches = [
+                (cid, rhs, subst)
+                for lhs, rhs in rules
+                for cid, subst in self.ematch(lhs)
+            ]
+
+            changed = False
+            for cid, rhs, subst in matches:
+                new_cid = self._add(rhs, subst)
+                if self.find(new_cid) != self.find(cid):
+                    self.union(cid, new_cid)
+                    changed = True
+
+                if max_nodes is not None and self._num_nodes > max_nodes:
+                    self.rebuild()
+                    return i + 1
+
+            self.rebuild()
+
+            if not changed:
+                return i
+
+        return max_iters
+
+    def extract(self, cid, cost_fn=ast_size):
+        """Return the lowest cost expression in an e-class.
+
+        Parameters
+        ----------
+        cid: int
+            The e-class id.
+        cost_fn: callable
+            A function called as ``cost_fn(x, arg_costs)`` that returns the
+            (positive) cost of an e-node given the costs of its operands.  For
+            leaves, ``x`` is the leaf and ``arg_costs`` is empty; otherwise,
+            ``x`` is the operator when that's a leaf (and ``None`` when it
+            isn't).
+
+        Returns
+        -------
+        An `ExpressionTuple` or, when a leaf is the best choice, the leaf
+        itself.
+        """
+        best = {}
+
+        for c, leaves in self._leaves.items():
+            for leaf in leaves:
+                cost = cost_fn(leaf, ())
+                if c not in best or cost < best[c][0]:
+                    best[c] = (cost, leaf, True)
+
+        changed = True
+        while changed:
+            changed = False
+            for c, nodes in self._nodes.items():
+                for node in nodes:
+                    if not node:
+                        continue
+
+                    costs = []
+                    for arg in node[1:]:
+                        arg_best = best.get(self.find(arg))
+                        if arg_best is None:
+                            break
+                        costs.append(arg_best[0])
+                    else:
+                        op_best = best.get(self.find(node[0]))
+                        if op_best is None:
+                            continue
+                        op = op_best[1] if op_best[2] else None
+                        cost = cost_fn(op, tuple(costs))
+                        if c not in best or cost < best[c][0]:
+                            best[c] = (cost, node, False)
+                            changed = True
+
+        cid = self.find(cid)
+
+        if cid not in best:
+            raise ValueError(f"E-class {cid} has no finite expression")
+
+        res = {}
+        stack = [(cid, False)]
+
+        while stack:
+            c, expanded = stack.pop()
+
+            if c in res:
+                continue
+
+            _, choice, is_leaf = best[c]
+
+            if is_leaf:
+                res[c] = choice
+            elif not expanded:
+                stack.append((c, True))
+                stack.extend((self.find(a), False) for a in choice)
+            else:
+                res[c] = ExpressionTuple.from_tuple(
+                    tuple(res[self.find(a)] for a in choice)
+                )
+
+        return res[cid]
@@ -0,0 +1,217 @@
+from .core import ExpressionTuple, KwdPair
+
+
+def _key(x):
+    """Return a dictionary key for `x`, or ``None`` if `x` isn't hashable."""
+    key = (type(x), x)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _elements(x):
+    """Return the elements of an `ExpressionTuple` with `KwdPair` values unwrapped."""
+    return tuple(i.value if isinstance(i, KwdPair) else i for i in x._tuple)
+
+
+class SubtermIndex:
+    """An index of the sub-terms in an `ExpressionTuple`.
+
+    The index maps each operator to the nodes (i.e. `ExpressionTuple`s) that
+    use it, and each (hashable) sub-term to the places at which it occurs, so
+    that queries like "all the nodes with operator ``add``" or "all the
+    parents of this sub-term" take time proportional to the size of their
+    answers.
+
+    A path is a `tuple` of element indices leading from the root to a
+    sub-term; the root's path is ``()``.  Sub-terms are indexed by value, so
+    equal sub-terms that are distinct objects share entries, and the
+    `KwdPair` elements of a node are indexed by their values.
+
+    Each distinct node is indexed once, along with links to the
+    ``(parent, position)`` pairs that refer to it, so the index is linear in
+    the number of distinct nodes even when they're shared.  Paths are built
+    from these links when they're queried.
+
+    The index is built once, and `SubtermIndex.replace` updates it
+    incrementally, in time proportional to the sizes of the old and new
+    sub-terms that aren't shared with the rest of the term and the depth of
+    the replacement.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        # Map node `id`s to nodes and to their ``(parent id, position)`` links
+        self._nodes = {}
+        self._parents = {}
+        # Map operator keys to the `id`s of the nodes that use them
+        self._by_rator = {}
+        # Map sub-term keys to their ``(parent id, position)`` links
+        self._occurrences = {}
+        self._link(root, self._root_link())
+
+    def _root_link(self):
+        # The root is linked to a parent `id` of ``None``; the root's own `id`
+        # tells the links of an old and a new (equal) root apart
+        return (None, id(self.root))
+
+    def _link(self, x, link):
+        stack = [(x, link)]
+
+        while stack:
+            x, link = stack.pop()
+
+            key = _key(x)
+            if key is not None:
+                self._occurrences.setdefault(key, set()).add(link)
+
+            if not isinstance(x, ExpressionTuple):
+                continue
+
+            links = self._parents.get(id(x))
+            if links is not None:
+                # The node (and everything under it) is already indexed
+                links.add(link)
+                continue
+
+            self._parents[id(x)] = {link}
+            self._nodes[id(x)] = x
+
+            elements = _elements(x)
+            if elements:
+                rator_key = _key(elements[0])
+                if rator_key is not None:
+                    self._by_rator.setdefault(rator_key, set()).add(id(x))
+
+            stack.extend((i, (id(x), n)) for n, i in enumerate(elements))
+
+    def _unlink(self, x, link):
+        stack = [(x, link)]
+
+        while stack:
+            x, link = stack.pop()
+
+            key = _key(x)
+            if key is not None:
+                links = self._occurrences[key]
+                links.discard(link)
+                if not links:
+                    del self._occurrences[key]
+
+            if not isinstance(x, ExpressionTuple):
+                continue
+
+            links = self._parents[id(x)]
+            links.discard(link)
+            if links:
+                # The node is still used elsewhere
+                continue
+
+            del self._parents[id(x)]
+            del self._nodes[id(x)]
+
+            elements = _elements(x)
+            if elements:
+                rator_key = _key(elements[0])
+                if rator_key is not None:
+                    nodes = self._by_rator[rator_key]
+                    nodes.discard(id(x))
+                    if not nodes:
+                        del self._by_rator[rator_key]
+
+            stack.extend((i, (id(x), n)) for n, i in enumerate(elements))
+
+    def _paths(self, links):
+        """Generate the paths that end with the given links."""
+        # Paths are built from the bottom up as linked lists of
+        # ``(position, rest)`` pairs, so that extending them is cheap
+        stack = [(link, None) for link in links]
+
+        while stack:
+            (parent_id, pos), rest = stack.pop()
+
+            if parent_id is None:
+                path = []
+                while rest is not None:
+                    pos, rest = rest
+                    path.append(pos)
+                yield tuple(path)
+                continue
+
+            rest = (pos, rest)
+            stack.extend((link, rest) for link in self._parents[parent_id])
+
+    def __getitem__(self, path):
+        """Return the sub-term at `path`."""
+        x = self.root
+
+        for pos in path:
+            if not isinstance(x, ExpressionTuple):
+                raise KeyError(path)
+
+            elements = _elements(x)
+            if not -len(elements) <= pos < len(elements):
+                raise KeyError(path)
+
+            x = elements[pos]
+
+        return x
+
+    def with_rator(self, op):
+        """Return the ``(path, node)`` pairs for the nodes with operator `op`."""
+        key = _key(op)
+        ids = self._by_rator.get(key, ()) if key is not None else ()
+        return [(p, self._nodes[i]) for i in ids for p in self._paths(self._parents[i])]
+
+    def occurrences(self, x):
+        """Return the paths at which `x` occurs."""
+        key = _key(x)
+        if key is None:
+            raise TypeError(f"Unhashable sub-terms aren't indexed: {type(x)}")
+        return list(self._paths(self._occurrences.get(key, ())))
+
+    def parents(self, x):
+        """Return the ``(path, node)`` pairs for the parent nodes of `x`."""
+        key = _key(x)
+        if key is None:
+            raise TypeError(f"Unhashable sub-terms aren't indexed: {type(x)}")
+        ids = {i for i, _ in self._occurrences.get(key, ()) if i is not None}
+        return [(p, self._nodes[i]) for i in ids for p in self._paths(self._parents[i])]
+
+    def replace(self, path, new):
+        """Replace the sub-term at `path` with `new` and update the index.
+
+        Since `ExpressionTuple`s are immutable, the ancestors of the replaced
+        sub-term are rebuilt, and the new root is returned (it's also
+        available as `SubtermIndex.root`).
+        """
+        # Also checks that `path` is valid
+        self[path]
+
+        ancestors = []
+        x = self.root
+        for pos in path:
+            ancestors.append(x)
+            x = _elements(x)[pos]
+
+        # Rebuild the ancestors from the bottom up
+        for parent, pos in zip(reversed(ancestors), reversed(path)):
+            items = list(parent._tuple)
+            item = items[pos]
+            items[pos] = KwdPair(item.arg, new) if isinstance(item, KwdPair) else new
+            new = type(parent).from_tuple(tuple(items))
+
+        if new is self.root:
+            return new
+
+        # The new root is indexed first, so that the sub-terms it shares with
+        # the old one aren't removed and then added again
+        old_link = self._root_link()
+        old_root = self.root
+        self.root = new
+        self._link(new, self._root_link())
+        self._unlink(old_root, old_link)
+
+        return new
@@ -0,0 +1,187 @@
+from collections import Counter
+
+from unification import reify, unify
+
+from .core import ExpressionTuple, KwdPair
+from .dispatch import apply, rands, rator
+
+_VISIT, _BUILD, _ALIAS = range(3)
+
+
+def _is_term(x):
+    """Determine whether or not `x` has sub-terms that can be rewritten.
+
+    That's the case for non-empty `ExpressionTuple`s and objects with their
+    own `rator` implementation (i.e. not the default `car` one).
+    """
+    if isinstance(x, ExpressionTuple):
+        return len(x) > 0
+    return rator.dispatch(type(x)) is not rator.dispatch(object)
+
+
+def _rands(x):
+    if isinstance(x, ExpressionTuple):
+        return x._tuple[1:]
+    return rands(x)
+
+
+def _children(x):
+    for a in _rands(x):
+        if isinstance(a, KwdPair):
+            a = a.value
+        if _is_term(a):
+            yield a
+
+
+class Rewriter:
+    """Rewrite terms to a normal form using a set of rules.
+
+    Rules are ``(pattern, replacement)`` pairs of terms containing
+    `unification` logic variables.  Terms are rewritten bottom-up: the operands
+    of a term are brought into normal form before the rules are tried on the
+    term itself, and the result of a rule is normalized in turn.
+
+    Terms can be `ExpressionTuple`s or any objects with `rator`, `rands` and
+    `apply` implementations.  Sub-terms that aren't changed are kept as-is
+    (along with their cached evaluations), and terms that are rebuilt because
+    their operands changed are constructed with `apply`
+    (`ExpressionTuple`s are rebuilt directly).
+
+    Normal forms are memoized by object identity, so a (shared) sub-term is
+    only ever normalized once per `Rewriter`; call `Rewriter.clear` to reset
+    the memo.  With ``structural=True``, normal forms are also memoized by
+    (hashable) term value, so equal sub-terms share a normal form even when
+    they're distinct objects.  The number of times each rule fired is counted in
+    `Rewriter.stats`, which is keyed by rule index.
+
+    The rules must be terminating (e.g. rules like commutativity will loop
+    forever).
+    """
+
+    def __init__(self, rules, structural=False):
+        self.rules = list(rules)
+        self.stats = Counter()
+        # Map `id`s to `(term, normal form)`; the terms are kept so that their
+        # `id`s can't be reused.
+        self._memo = {}
+        self._structural_memo = {} if structural else None
+
+    def clear(self):
+        """Clear the normal form memo and the rule statistics."""
+        self._memo.clear()
+        if self._structural_memo is not None:
+            self._structural_memo.clear()
+        self.stats.clear()
+
+    def _structural_get(self, x):
+        if self._structural_memo is None:
+            return None
+        try:
+            return self._structural_memo.get(x)
+        except TypeError:
+            return None
+
+    def _structural_set(self, x, nf):
+        if self._structural_memo is None:
+            return
+        try:
+            self._structural_memo[x] = nf
+        except TypeError:
+            pass
+
+    def _apply_rules(self, x):
+        for i, (lhs, rhs) in enumerate(self.rules):
+            s = unify(lhs, x, {})
+            if s is not False:
+                res = reify(rhs, s)
+                if res is not x:
+                    self.stats[i] += 1
+                    return res
+        return None
+
+    def _rebuild(self, x):
+        memo = self._memo
+        args = _rands(x)
+
+        new_args = []
+        changed = False
+        for a in args:
+            if isinstance(a, KwdPair):
+                if id(a.value) in memo:
+                    new_value = memo[id(a.value)][1]
+                    if new_value is not a.value:
+                        a = KwdPair(a.arg, new_value)
+                        changed = True
+            elif id(a) in memo:
+                new_a = memo[id(a)][1]
+                if new_a is not a:
+                    a = new_a
+                    changed = True
+            new_args.append(a)
+
+        if not changed:
+            return x
+
+        if isinstance(x, ExpressionTuple):
+            return type(x).from_tuple((x._tuple[0],) + tuple(new_args))
+
+        return apply(
+            rator(x), list(new_args) if isinstance(args, list) else tuple(new_args)
+        )
+
+    def _finish(self, x, y, stack):
+        """Finish normalizing `x`, given `y`, its version with normalized operands."""
+        nf = self._structural_get(y)
+
+        if nf is not None:
+            self._memo[id(x)] = (x, nf)
+            return
+
+        new = self._apply_rules(y)
+
+        if new is None:
+            self._memo[id(x)] = (x, y)
+            self._memo[id(y)] = (y, y)
+            self._structural_set(y, y)
+        else:
+            stack.append((_ALIAS, x, (y, new)))
+            stack.append((_VISIT, new, None))
+
+    def __call__(self, term):
+        """Return the normal form of `term`."""
+        memo = self._memo
+        stack = [(_VISIT, term, None)]
+
+        while stack:
+            kind, x, y = stack.pop()
+
+            if kind == _VISIT:
+                if id(x) in memo:
+                    continue
+
+                if not _is_term(x):
+                    self._finish(x, x, stack)
+                    continue
+
+                stack.append((_BUILD, x, None))
+                stack.extend(
+                    (_VISIT, c, None) for c in _children(x) if id(c) not in memo
+                )
+            elif kind == _BUILD:
+                self._finish(x, self._rebuild(x), stack)
+            else:
+                # `x` was rewritten to `new`, which is now normalized
+                y, new = y
+                nf = memo[id(new)][1]
+                memo[id(x)] = (x, nf)
+                self._structural_set(y, nf)
+
+        return memo[id(term)][1]
+
+
+def rewrite(term, rules, structural=False):
+    """Rewrite `term` to a normal form using `rules`.
+
+    See `Rewriter`.
+    """
+    return Rewriter(rules, structural=structural)(term)
@@ -0,0 +1,155 @@
+import sys
+from operator import add, mul, neg
+
+import pytest
+
+import etuples
+from etuples.analysis import Edit, Stats, diff, stats
+from etuples.arena import TermArena
+from etuples.core import etuple
+
+from .test_core import gen_long_add_chain
+
+
+def test_diff():
+    assert etuples.diff is diff
+
+    sub = etuple(add, "x", 1)
+    a = etuple(mul, sub, etuple(neg, "y"), 3)
+
+    assert diff(a, a) == []
+    assert diff(a, etuple(mul, etuple(add, "x", 1), etuple(neg, "y"), 3)) == []
+    assert diff(1, 1) == []
+    assert diff(1, 2) == [Edit("replace", (), 1, 2)]
+    assert diff(a, 1) == [Edit("replace", (), a, 1)]
+
+    b = etuple(mul, sub, etuple(neg, "z"), 3)
+    assert diff(a, b) == [Edit("replace", (2, 1), "y", "z")]
+
+    b = etuple(add, etuple(add, "x", 2), etuple(neg, "y"), 4)
+    assert diff(a, b) == [
+        Edit("replace", (0,), mul, add),
+        Edit("replace", (1, 2), 1, 2),
+        Edit("replace", (3,), 3, 4),
+    ]
+
+    # Insertions and removals
+    b = etuple(mul, sub, "w", etuple(neg, "y"), 3)
+    assert diff(a, b) == [Edit("insert", (2,), None, "w")]
+    assert diff(b, a) == [Edit("remove", (2,), "w", None)]
+
+    b = etuple(mul, sub, 4, 5)
+    assert diff(a, b) == [
+        Edit("replace", (2,), a[2], 4),
+        Edit("replace", (3,), 3, 5),
+    ]
+    assert diff(etuple(mul, 1, 2), etuple(mul, 3, 2, 4, 5)) == [
+        Edit("replace", (1,), 1, 3),
+        Edit("insert", (3,), None, 4),
+        Edit("insert", (4,), None, 5),
+    ]
+
+    # Keyword arguments
+    a = etuple(dict, a=etuple(add, 1, 2), b=3)
+    b = etuple(dict, a=etuple(add, 1, 3), b=3)
+    assert diff(a, b) == [Edit("replace", (1, 2), 2, 3)]
+    b = etuple(dict, c=etuple(add, 1, 2), b=3)
+    assert diff(a, b) == [Edit("replace", (1,), a[1], b[1])]
+
+    # Values with unusual comparisons
+    class Ambiguous:
+        def __eq__(self, other):
+            raise ValueError()
+
+    x, y = Ambiguous(), Ambiguous()
+    assert diff(etuple(add, x, 1), etuple(add, y, 1)) == [Edit("replace", (1,), x, y)]
+    assert diff(etuple(add, [1], 1), etuple(add, [1], 1)) == []
+
+
+def test_diff_recursion_limit():
+    a = gen_long_add_chain(200)
+    b = gen_long_add_chain(199)
+    b = etuple(add, 2, b)
+
+    r_limit = sys.getrecursionlimit()
+
+    try:
+        sys.setrecursionlimit(100)
+        assert diff(a, b) == [Edit("replace", (1,), 1, 2)]
+
+        b = etuple(add, 1, 2)
+        for _ in range(199):
+            b = etuple(add, 1, b)
+        assert diff(a, b) == [Edit("replace", (2,) * 200, 1, 2)]
+    finally:
+        sys.setrecursionlimit(r_limit)
+
+
+def test_diff_shared():
+    """Make sure that shared sub-expressions aren't compared."""
+
+    class NoEq:
+        def __eq__(self, other):
+            raise AssertionError()
+
+        __hash__ = object.__hash__
+
+    shared = etuple(add, NoEq(), etuple(neg, NoEq()))
+    a = etuple(mul, shared, etuple(add, shared, 1))
+    b = etuple(mul, shared, etuple(add, shared, 2))
+    assert diff(a, b) == [Edit("replace", (2, 2), 1, 2)]
+
+
+def test_stats():
+    assert etuples.stats is stats
+
+    with pytest.raises(TypeError):
+        stats((add, 1))
+
+    assert stats(etuple(add, 1, 2)) == Stats(1, 1, 1, 2, 0, 0, 0)
+
+    def f(x, y, z=0):
+        return x * y + z
+
+    a = etuple(add, 1, 2)
+    b = etuple(f, a, a, z=etuple(neg, a))
+    assert stats(b) == Stats(5, 3, 3, 3, 0, 0, 0)
+
+    assert b.evaled_obj == 6
+    c = etuple(add, a, etuple(neg, 3))
+    c._evaled_obj = 3
+
+    res = stats(b)
+    assert res.evaluated == 3
+    assert res.evaluated_bytes == sum(map(sys.getsizeof, (6, 3, -3)))
+
+    # Evaluations shared by several nodes are only counted once
+    res = stats(c)
+    assert res.evaluated == 2
+    assert res.evaluated_bytes == sys.getsizeof(3)
+
+    assert stats(b[1:]).parent_links == 1
+
+    # Arena handles are distinct objects for the same node
+    assert stats(TermArena().add(b))[:4] == stats(b)[:4]
+
+
+def test_stats_shared():
+    # The tree size grows exponentially with the depth of this DAG
+    x = etuple(add, 1, 2)
+    for _ in range(100):
+        x = etuple(add, x, x)
+
+    res = stats(x)
+    assert res.nodes == 2**101 - 1
+    assert res.distinct_nodes == 101
+    assert res.depth == 101
+
+    r_limit = sys.getrecursionlimit()
+
+    try:
+        sys.setrecursionlimit(100)
+        res = stats(gen_long_add_chain(200))
+        assert res.nodes == res.distinct_nodes == res.depth == 200
+    finally:
+        sys.setrecursionlimit(r_limit)
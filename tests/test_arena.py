@@ -0,0 +1,174 @@
+import gc
+import random
+import sys
+import tracemalloc
+from decimal import Decimal
+from operator import add, mul
+
+import pytest
+
+from etuples.arena import ArenaTerm, TermArena
+from etuples.core import _UNHASHABLE, ExpressionTuple, KwdPair, canonical_key, etuple
+from etuples.dispatch import apply, rands, rator
+
+from .test_core import gen_long_add_chain
+
+
+def test_TermArena():
+    arena = TermArena()
+
+    sub = etuple(add, 1, 2)
+    et = etuple(mul, sub, etuple(add, sub, [3]), sub)
+    h = arena.add(et)
+
+    assert isinstance(h, ArenaTerm)
+    assert isinstance(h, ExpressionTuple)
+    assert len(arena) == 3
+    assert len(h) == 4
+
+    assert h == et
+    assert et == h
+    assert h == arena.term(h._index)
+    assert str(h) == str(et)
+
+    assert h[0] is mul
+    assert h[-1] == sub
+    assert h[2][2] == [3]
+    with pytest.raises(IndexError):
+        h[4]
+    with pytest.raises(IndexError):
+        arena.term(3)
+
+    # Shared sub-expressions are stored once
+    assert h[1]._index == h[3]._index == h[2][1]._index
+
+    # Adding a handle from the same arena doesn't add anything
+    assert arena.add(h) is h
+    h_2 = arena.add(etuple(add, h[1], 4))
+    assert len(arena) == 4
+    assert h_2[1]._index == h[1]._index
+
+    assert rator(h) is mul
+    assert rands(h) == et[1:]
+    assert not isinstance(rands(h), ArenaTerm)
+    assert isinstance((mul,) + rands(h), ExpressionTuple)
+
+    assert list(arena.postorder(h._index)) == [h[1]._index, h[2]._index, h._index]
+
+    with pytest.raises(TypeError):
+        arena.add((add, 1, 2))
+
+    assert type(ArenaTerm((add, 1, 2))) is ExpressionTuple
+
+    assert hash(arena.add(sub)) == hash(sub)
+
+
+def test_TermArena_leaves():
+    arena = TermArena()
+
+    # Equal leaves that aren't interchangeable are kept apart
+    h = arena.add(etuple(add, 0.0, -0.0, Decimal("1"), Decimal("1.00"), 1, True))
+    assert str(h[2]) == "-0.0"
+    assert str(h[4]) == "1.00"
+    assert type(h[5]) is int
+    assert h[6] is True
+
+    # Equal values of simple types are interned
+    h_2 = arena.add(etuple(add, 10**20, "a" * 100))
+    h_3 = arena.add(etuple(add, 10**20, "a" * 100))
+    assert h_2[1] is h_3[1]
+    assert h_2[2] is h_3[2]
+
+
+def test_TermArena_eval():
+    arena = TermArena()
+
+    h = arena.add(etuple(add, etuple(mul, 2, 3), 4))
+    assert h.evaled_obj == 10
+
+    # Evaluations are cached in the arena
+    assert arena.term(h._index)._evaled_obj == 10
+    assert arena.term(h[1]._index)._evaled_obj == 6
+
+    def kwd_fn(a=None, b=None):
+        return {"a": a, "b": b}
+
+    h = arena.add(etuple(kwd_fn, a=etuple(add, 1, 1), b=2))
+    assert h[1] == KwdPair("a", etuple(add, 1, 1))
+    assert h.evaled_obj == {"a": 2, "b": 2}
+
+    # Cached evaluations are carried over
+    et = etuple(add, 1, 2, evaled_obj=4)
+    assert arena.add(et).evaled_obj == 4
+
+    assert apply(add, rands(arena.add(etuple(add, 1, 2)))) == 3
+
+
+def test_TermArena_compare():
+    arena = TermArena()
+    rng = random.Random(0)
+
+    def make_term(depth):
+        if depth == 0:
+            # `Decimal`s are compared by walking the expressions
+            return Decimal(rng.randint(0, 2))
+        return etuple(
+            rng.choice((add, mul)), make_term(depth - 1), make_term(depth - 1)
+        )
+
+    # Handles are created while they're compared, so their `id`s are reused
+    for i in range(500):
+        a, b = make_term(3), make_term(3)
+        h_a, h_b = arena.add(a), arena.add(b)
+        assert (h_a < h_b, h_a == h_b, h_a > h_b) == (a < b, a == b, a > b)
+        assert (canonical_key(h_a) < canonical_key(h_b)) == (a < b)
+
+
+def test_TermArena_recursion_limit():
+    arena = TermArena()
+    et = gen_long_add_chain(200)
+
+    r_limit = sys.getrecursionlimit()
+
+    try:
+        sys.setrecursionlimit(100)
+        h = arena.add(et)
+        assert len(arena) == 200
+        assert len(list(arena.postorder(h._index))) == 200
+        assert h.evaled_obj == 201
+        assert h == et
+
+        # Hashes are computed without recursion and cached in the arena
+        h = arena.add(gen_long_add_chain(2000))
+        assert hash(h) == hash(gen_long_add_chain(2000))
+        assert arena.term(h._index)._hash == hash(h)
+        assert h[2]._hash is not None
+        assert hash(h[2]) == hash(gen_long_add_chain(2000)[2])
+
+        h = arena.add(etuple(add, gen_long_add_chain(200), [1]))
+        with pytest.raises(TypeError):
+            hash(h)
+        assert h._hash is _UNHASHABLE
+        assert hash(h[1]) == hash(gen_long_add_chain(200))
+    finally:
+        sys.setrecursionlimit(r_limit)
+
+
+def test_TermArena_memory():
+    gc.collect()
+    tracemalloc.start()
+    try:
+        et = gen_long_add_chain(5000)
+        et_size, _ = tracemalloc.get_traced_memory()
+
+        arena = TermArena()
+        arena.add(et)
+        del et
+        gc.collect()
+        arena_size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert len(arena) == 5000
+    # The arena should take a fraction of the memory
+    assert 3 * arena_size < et_size
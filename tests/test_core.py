@@ -1,10 +1,31 @@
+import copy
+import io
+import pickle
 import sys
-from operator import add
+from decimal import Decimal
+from operator import add, mul
 from types import GeneratorType
 
 import pytest
 
-from etuples.core import ExpressionTuple, InvalidExpression, KwdPair, etuple
+from etuples.core import (
+    _EVALUATED,
+    _PLAN_ARG,
+    _PLAN_KWD,
+    _PLAN_KWD_TERM,
+    _PLAN_TERM,
+    _UNHASHABLE,
+    ExpressionTuple,
+    GeneratorCache,
+    InvalidExpression,
+    KwdPair,
+    _signature,
+    canonical_key,
+    etuple,
+    etuple_str,
+    live_instances,
+    track_instances,
+)
 
 
 def test_ExpressionTuple(capsys):
@@ -83,6 +104,59 @@ def test_eval_apply_fn():
     assert AddExpressionTuple((op, 1, 2)).evaled_obj == 3
 
 
+def test_eval_plan():
+    calls = []
+
+    class CountingExpressionTuple(ExpressionTuple):
+        def _eval_apply_fn(self, op):
+            calls.append(op)
+            return op
+
+    def f(x, y, z=0, **kwargs):
+        return (x, y, z, kwargs)
+
+    e = CountingExpressionTuple((f, etuple(add, 1, 2), 3), z=etuple(mul, 2, 2), w=5)
+    assert e._eval_plan is None
+    assert e.evaled_obj == (3, 3, 4, {"w": 5})
+
+    # The plan isn't kept after the first evaluation
+    assert e._eval_plan is _EVALUATED
+    assert calls == [f]
+
+    # Re-evaluations keep the plan
+    e._evaled_obj = ExpressionTuple.null
+    e[1]._evaled_obj = ExpressionTuple.null
+    assert e.evaled_obj == (3, 3, 4, {"w": 5})
+    plan = e._eval_plan
+    assert plan == (
+        (_PLAN_TERM, 1),
+        (_PLAN_ARG, 3),
+        (_PLAN_KWD_TERM, ("z", 3)),
+        (_PLAN_KWD, ("w", 5)),
+    )
+
+    e._evaled_obj = ExpressionTuple.null
+    assert e.evaled_obj == (3, 3, 4, {"w": 5})
+    assert e._eval_plan is plan
+    assert calls == [f, f, f]
+
+    # Signatures are shared by the expressions that use the same callables
+    assert _signature(f) is _signature(f)
+    assert _signature(add) is _signature(add)
+    assert _signature(max) is None
+
+    # Sub-terms that evaluate to `KwdPair`s are keyword arguments, and the
+    # callables of evaluated operators are resolved when they change
+    op = ExpressionTuple((lambda: f,))
+    e = etuple(op, 1, etuple(KwdPair, "y", 2))
+    assert e.evaled_obj == (1, 2, 0, {})
+
+    # `max` has no signature, so keyword arguments are passed by position
+    op._evaled_obj = max
+    e._evaled_obj = ExpressionTuple.null
+    assert e.evaled_obj == 2
+
+
 def test_etuple():
     """Test basic `etuple` functionality."""
 
@@ -134,13 +208,171 @@ def test_etuple():
     assert e_ladd == (1, 2, 3)
 
 
+def test_from_tuple():
+    t = (add, 1, 2)
+    e = ExpressionTuple.from_tuple(t)
+    assert e._tuple is t
+    assert e._parent is None
+    assert e._evaled_obj is ExpressionTuple.null
+    assert e == etuple(add, 1, 2)
+    assert e.evaled_obj == 3
+
+    e = ExpressionTuple.from_tuple(t, evaled_obj=4)
+    assert e.evaled_obj == 4
+
+
+def test_from_postorder():
+    kw = KwdPair("b", None)
+    nodes = [
+        ((add, 1, 2), (), ExpressionTuple.null),
+        ((add, None, 3), ((1, 0),), ExpressionTuple.null),
+        ((dict, None, None, kw), ((1, 0), (2, 1), (3, 0)), ExpressionTuple.null),
+        ((add, 1, 1), (), 2),
+    ]
+    res = ExpressionTuple.from_postorder(nodes)
+
+    assert len(res) == 4
+    e0, e1, e2, e3 = res
+    assert e1 == etuple(add, etuple(add, 1, 2), 3)
+    assert e1[1] is e0
+    assert e2[1] is e0 and e2[2] is e1 and e2[3].value is e0
+    assert e3._evaled_obj == 2
+    assert kw.value is None
+
+    assert e1.evaled_obj == 6
+    assert e0._evaled_obj == 3
+
+
+def test_to_postorder():
+    a = etuple(add, 1, 2)
+    b = etuple(mul, a, a, x=a)
+    nodes = b.to_postorder()
+
+    assert nodes == [
+        ((add, 1, 2), (), ExpressionTuple.null),
+        ((mul, None, None, KwdPair("x", None)), ((1, 0), (2, 0), (3, 0)), b.null),
+    ]
+    assert ExpressionTuple.from_postorder(nodes)[-1] == b
+
+
+class MyExpressionTuple(ExpressionTuple):
+    pass
+
+
+def test_pickle():
+    a = etuple(add, 1, 2)
+    b = etuple(add, a, a)
+    b.evaled_obj
+
+    res = pickle.loads(pickle.dumps(b))
+    assert res == b
+    assert res[1] is res[2]
+    assert res._evaled_obj == 6
+    assert res[1]._evaled_obj == 3
+
+    res = pickle.loads(pickle.dumps(etuple(add, 1, 2)))
+    assert res._evaled_obj is ExpressionTuple.null
+    assert res.evaled_obj == 3
+
+    # Node types and parent links are kept
+    a = etuple(add, MyExpressionTuple((add, 1, 2)), 3)
+    b = a[1:]
+    for res in (pickle.loads(pickle.dumps(b)), copy.deepcopy(b)):
+        assert res == b
+        assert type(res[0]) is MyExpressionTuple
+        assert res._parent == a
+        assert res._parent[1] is res[0]
+        assert (add,) + res is res._parent
+
+    # Shallow copies share their elements
+    res = copy.copy(b)
+    assert res == b and res is not b
+    assert type(res[0]) is MyExpressionTuple
+    assert res[0] is b[0]
+    assert res._parent is b._parent
+
+    sub = etuple(add, 1, 2)
+    res = copy.copy(etuple(add, sub, 3))
+    assert res[1] is sub
+
+    r_limit = sys.getrecursionlimit()
+
+    try:
+        sys.setrecursionlimit(100)
+        a = gen_long_add_chain(200)
+        res = pickle.loads(pickle.dumps(a))
+        assert res == a
+        assert copy.copy(a)[1] is a[1]
+    finally:
+        sys.setrecursionlimit(r_limit)
+
+
 def test_etuple_generator():
     e_gen = etuple(lambda v: (i for i in v), range(3))
     e_gen_res = e_gen.evaled_obj
     assert isinstance(e_gen_res, GeneratorType)
+    assert e_gen.evaled_obj is e_gen_res
     assert tuple(e_gen_res) == tuple(range(3))
 
 
+def test_etuple_generator_stream(monkeypatch):
+    monkeypatch.setattr(ExpressionTuple, "stream_generators", True)
+
+    pulled = []
+
+    def gen_range(n):
+        for i in range(n):
+            pulled.append(i)
+            yield i
+
+    def gen_map(fn, it):
+        return (fn(i) for i in it)
+
+    e_src = etuple(gen_range, 5)
+    e_gen = etuple(gen_map, lambda x: 2 * x, e_src)
+
+    e_gen_res = e_gen.evaled_obj
+    assert isinstance(e_gen_res, GeneratorCache)
+    assert e_gen.evaled_obj is e_gen_res
+    assert pulled == []
+
+    # Downstream consumers pull results incrementally
+    it = iter(e_gen_res)
+    assert next(it) == 0
+    assert next(it) == 2
+    assert pulled == [0, 1]
+
+    # Cached results are replayed
+    assert list(e_gen_res) == [0, 2, 4, 6, 8]
+    assert list(e_gen_res) == [0, 2, 4, 6, 8]
+    assert list(it) == [4, 6, 8]
+    assert list(e_src.evaled_obj) == [0, 1, 2, 3, 4]
+    assert pulled == [0, 1, 2, 3, 4]
+
+    monkeypatch.setattr(ExpressionTuple, "stream_maxlen", 2)
+
+    e_gen = etuple(gen_range, 5)
+    e_gen_res = e_gen.evaled_obj
+    assert e_gen_res.maxlen == 2
+
+    it_1, it_2 = iter(e_gen_res), iter(e_gen_res)
+    assert list(it_1) == [0, 1, 2, 3, 4]
+    assert len(e_gen_res._buffer) == 2
+
+    with pytest.raises(ValueError):
+        next(it_2)
+
+    # Consumers that keep up with each other only need a small buffer
+    gen_cache = GeneratorCache(iter(range(5)), maxlen=1)
+    assert list(zip(gen_cache, gen_cache)) == [(i, i) for i in range(5)]
+
+    # Unbounded caches keep their results in a `list`, so replays are linear
+    gen_cache = GeneratorCache(iter(range(5)))
+    assert gen_cache.maxlen is None
+    assert list(gen_cache) == list(gen_cache) == [0, 1, 2, 3, 4]
+    assert isinstance(gen_cache._buffer, list)
+
+
 def test_etuple_kwargs():
     """Test keyword arguments and default argument values."""
 
@@ -212,6 +444,43 @@ def test_str():
 
     assert repr(kw) == "KwdPair('a', 1)"
     assert str(kw) == "a=1"
+    assert str(KwdPair("a", etuple("b", 1))) == "a=e(b, 1)"
+
+
+def test_etuple_str():
+    et = etuple("f", etuple("g", 1, 2, 3), etuple("h", etuple("i", 4)), kw="a")
+    assert etuple_str(et) == str(et) == "e(f, e(g, 1, 2, 3), e(h, e(i, 4)), kw=a)"
+
+    assert etuple_str(et, max_depth=1) == "e(f, e(...), e(...), kw=a)"
+    assert etuple_str(et, max_depth=0) == "e(...)"
+    assert etuple_str(et, max_width=2) == "e(f, e(g, 1, ...), ...)"
+    assert etuple_str(et, max_width=0) == "e(...)"
+    assert etuple_str(et, max_length=10) == "e(f, e(g, ..."
+    assert etuple_str(et, max_length=1000) == str(et)
+
+    out = io.StringIO()
+    assert etuple_str(et, file=out) is None
+    assert out.getvalue() == str(et)
+
+    sub = etuple("g", 1)
+    et = etuple("f", sub, etuple("h", sub), sub)
+    assert str(et) == "e(f, e(g, 1), e(h, e(g, 1)), e(g, 1))"
+    assert etuple_str(et, share=True) == "e(f, #1=e(g, 1), e(h, #1#), #1#)"
+
+    # Exponentially large when expanded, but cheap when shared
+    et = etuple("g", 1)
+    for i in range(100):
+        et = etuple("f", et, et)
+    assert etuple_str(et, share=True).count("#") == 3 * 100
+
+    r_limit = sys.getrecursionlimit()
+
+    try:
+        sys.setrecursionlimit(100)
+        et = gen_long_add_chain(200)
+        assert str(et).count("e(") == 200
+    finally:
+        sys.setrecursionlimit(r_limit)
 
 
 def test_pprint():
@@ -222,6 +491,15 @@ def test_pprint():
         == "e(\n  1,\n  e('a', 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19),\n  e(3, 'b'),\n  blah=e(c, 0))"  # noqa: E501
     )
 
+    r_limit = sys.getrecursionlimit()
+
+    try:
+        sys.setrecursionlimit(100)
+        et = gen_long_add_chain(150)
+        assert pretty_mod.pretty(et).count("e(") == 150
+    finally:
+        sys.setrecursionlimit(r_limit)
+
 
 def gen_long_add_chain(N=None, num=1):
     b_struct = num
@@ -254,20 +532,177 @@ def test_reify_recursion_limit():
         sys.setrecursionlimit(r_limit)
 
 
-@pytest.mark.skip(
-    reason=(
-        "This will cause an unrecoverable stack overflow"
-        " in some cases (e.g. GitHub Actions' default ubuntu-latest runners)"
-    )
-)
-@pytest.mark.xfail(strict=True)
 def test_reify_recursion_limit_hash():
+    a = gen_long_add_chain(10)
+    assert hash(a) == hash((add, 1, gen_long_add_chain(9)._tuple))
+
     r_limit = sys.getrecursionlimit()
 
     try:
         sys.setrecursionlimit(100)
         a = gen_long_add_chain(200)
-        # CPython uses the call stack and fails
-        assert hash(a)
+        # CPython uses the call stack for nested `tuple`s, so we don't
+        assert hash(a) == hash(gen_long_add_chain(200))
+        assert a._hash is not None
+        assert a[2]._hash is not None
+
+        # Unhashable elements are only found once
+        a = etuple(add, gen_long_add_chain(200), [1])
+        with pytest.raises(TypeError):
+            hash(a)
+        assert a._hash is _UNHASHABLE
+        assert a[1]._hash is not _UNHASHABLE
+        b = etuple(mul, a, 1)
+        with pytest.raises(TypeError):
+            hash(b)
+        assert b._hash is _UNHASHABLE
     finally:
         sys.setrecursionlimit(r_limit)
+
+
+def test_canonical_key():
+    assert canonical_key(etuple(add, 1, 2)) == canonical_key((add, 1, 2))
+    assert canonical_key(etuple(add, 1, 2)) != canonical_key(etuple(add, 1, 2.5))
+
+    # Prefixes first, then element-wise
+    assert etuple(add, 1) < etuple(add, 1, 2) < etuple(add, 2)
+    assert etuple(add, 1, 2) <= etuple(add, 1, 2)
+    assert etuple(mul, 1) > etuple(add, 1, 2)
+    assert etuple(mul, 1) >= etuple(add, 2)
+
+    # Uncomparable operators and leaves of different types are ordered
+    terms = [
+        etuple(mul, etuple(add, "a", 1), None),
+        etuple(add, 1.0, b"b"),
+        etuple(add, float("nan"), 1),
+        etuple(add, etuple(mul, 2), x=3),
+        etuple(add, 1.0, "a"),
+        etuple(add, object, 1),
+    ]
+    res = sorted(terms)
+    assert res == sorted(reversed(terms))
+    assert [terms.index(t) for t in res] == [3, 4, 1, 2, 5, 0]
+
+    # Comparisons with non-`ExpressionTuple`s are still `tuple` comparisons
+    assert etuple(1, 2) < (1, 3)
+    with pytest.raises(TypeError):
+        etuple(add, 1) < (mul, 1)
+
+    # Distinct objects that would otherwise be tied are ordered consistently
+    def fn_1():
+        pass
+
+    def fn_2():
+        pass
+
+    fn_2.__qualname__ = fn_1.__qualname__
+    obj_1, obj_2 = object(), object()
+    for x, y in ((fn_1, fn_2), (obj_1, obj_2), (float("nan"), float("nan"))):
+        assert etuple(x) != etuple(y)
+        assert (etuple(x) < etuple(y)) != (etuple(y) < etuple(x))
+        assert canonical_key(etuple(x)) != canonical_key(etuple(y))
+        assert canonical_key(etuple(x)) == canonical_key(etuple(x))
+
+    # Memory addresses in `repr`s aren't used
+    class Leaf:
+        def __init__(self, name):
+            self.name = name
+
+        def __repr__(self):
+            return f"<Leaf {self.name} at {hex(id(self))}>"
+
+    leaves = [Leaf(n) for n in "cab"]
+    assert [x.name for x in sorted(leaves, key=canonical_key)] == ["a", "b", "c"]
+
+    # Shared sub-terms are only compared once
+    a, b = 1, 1
+    for i in range(100):
+        a = etuple(add, a, a)
+        b = etuple(add, b, b)
+    assert canonical_key(a) == canonical_key(b)
+    assert not a < b
+    assert a <= b
+    assert a < etuple(add, a[1], etuple(add, a[1][1], 2))
+
+    r_limit = sys.getrecursionlimit()
+
+    try:
+        sys.setrecursionlimit(100)
+        a = gen_long_add_chain(200)
+        b = gen_long_add_chain(200, num=2)
+        assert a < b
+        assert sorted([b, a]) == [a, b]
+    finally:
+        sys.setrecursionlimit(r_limit)
+
+
+def test_canonical_key_cache():
+    a = etuple(add, etuple(mul, 2, "x"), 1.5)
+    b = etuple(add, etuple(mul, 2, "y"), 1.5)
+
+    # The keys of small expressions are compared as `tuple`s, and the tokens
+    # are cached per node
+    key = canonical_key(a)
+    assert isinstance(key, tuple)
+    assert a._key is not None
+    assert a[1]._key is not None
+    assert key < canonical_key(b)
+    assert key[0] is canonical_key(b)[0]
+
+    # Keys that need checks are compared with those that don't
+    c = etuple(add, etuple(mul, 2, Decimal("1")), 1.5)
+    d = etuple(add, etuple(mul, 2, float("nan")), 1.5)
+    terms = [c, b, d, a]
+    assert sorted(terms, key=canonical_key) == sorted(terms) == [d, a, b, c]
+    assert sorted(reversed(terms), key=canonical_key) == [d, a, b, c]
+
+
+def test_weak_parents(monkeypatch):
+    monkeypatch.setattr(ExpressionTuple, "weak_parents", True)
+
+    e1 = etuple(add, etuple(add, 1, 2), 3)
+    e1.evaled_obj
+
+    e2 = e1[1:]
+    assert e2._resolve_parent() is e1
+    assert e1[:1] + e2 is e1
+    assert (add,) + e2 is e1
+
+    # Slices don't keep their parents (or their cached results) alive
+    del e1
+    assert e2._resolve_parent() is None
+
+    e3 = (add,) + e2
+    assert e3 == etuple(add, etuple(add, 1, 2), 3)
+    assert e3._evaled_obj is ExpressionTuple.null
+
+    monkeypatch.setattr(ExpressionTuple, "weak_parents", False)
+
+    e1 = etuple(add, 1, 2)
+    e2 = e1[1:]
+    del e1
+    assert (add,) + e2 is e2._parent
+
+
+def test_track_instances():
+    assert live_instances() == {}
+
+    track_instances()
+
+    try:
+        a = etuple(add, 1, 2, x=3)
+        b = a[1:]
+        assert live_instances() == {ExpressionTuple: 2, KwdPair: 1}
+
+        # `b` keeps its parent alive
+        kw = a[-1]
+        del a
+        assert live_instances() == {ExpressionTuple: 2, KwdPair: 1}
+
+        del b
+        assert live_instances() == {KwdPair: 1}
+        assert kw.value == 3
+    finally:
+        track_instances(False)
+
+    assert live_instances() == {}
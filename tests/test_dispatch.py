@@ -1,10 +1,12 @@
 from collections.abc import Sequence
-from operator import add
+from concurrent.futures import ProcessPoolExecutor
+from operator import add, sub
 
 from pytest import importorskip, raises
 
+from etuples.arena import TermArena
 from etuples.core import ExpressionTuple, KwdPair, etuple
-from etuples.dispatch import apply, etuplize, rands, rator
+from etuples.dispatch import apply, etuplize, etuplize_many, rands, rator
 
 
 class Node:
@@ -111,6 +113,75 @@ def test_etuplize():
     )
 
 
+def test_etuplize_memo():
+    op_1, op_2 = Operator("*"), Operator("+")
+    node_1 = Node(op_2, [1, 2])
+    node_2 = Node(op_1, [node_1, node_1])
+    node_3 = Node(op_2, [node_1, 3])
+
+    res = etuplize(node_2)
+    assert res[1] is not res[2]
+
+    memo = {}
+    res_2 = etuplize(node_2, memo=memo)
+    assert res_2 == res
+    assert res_2[1] is res_2[2]
+    assert res_2[1].evaled_obj is node_1
+
+    res_3 = etuplize(node_3, memo=memo)
+    assert res_3[1] is res_2[1]
+
+    # Objects converted with other options aren't reused
+    with raises(TypeError):
+        etuplize(op_1, memo=memo)
+
+    with raises(TypeError):
+        etuplize_many([node_2, op_1])
+
+    assert etuplize(node_1, shallow=True, memo=memo) is not res_2[1]
+
+
+def rands_transform(x):
+    return 4 if x == 1 else x
+
+
+def test_etuplize_many():
+    op_1, op_2 = Operator("*"), Operator("+")
+    node_1 = Node(op_2, [1, 2])
+    objs = [Node(op_1, [node_1, i]) for i in range(10)] + ["ab"]
+
+    with raises(TypeError):
+        etuplize_many(objs)
+
+    with raises(ValueError):
+        etuplize_many(objs, chunksize=0)
+
+    res = etuplize_many(objs, chunksize=3, return_bad_args=True)
+    assert res[:-1] == [etuplize(o) for o in objs[:-1]]
+    assert res[-1] == "ab"
+    assert res[0][1] is res[2][1]
+    assert res[0][1] is not res[3][1]
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        res = etuplize_many(
+            objs,
+            executor=executor,
+            chunksize=3,
+            return_bad_args=True,
+            rands_transform_fn=rands_transform,
+        )
+
+    # The results (and their operators) were pickled
+    assert [r[2] for r in res[:-1]] == [rands_transform(i) for i in range(10)]
+    assert all(r[0].op_name == "*" for r in res[:-1])
+    assert res[0][1][0].op_name == "+"
+    assert res[0][1][1:] == etuple(4, 2)
+    assert res[-1] == "ab"
+    assert res[0][1] is res[2][1]
+    assert res[0][1] is not res[3][1]
+    assert isinstance(res[0][1]._evaled_obj, Node)
+
+
 def test_unification():
     from cons import cons
 
@@ -182,3 +253,81 @@ def test_unification():
     e2 = etuple(add, 1, name=a_lv)
     assert unify(e1, e2, {}) == {a_lv: "blah"}
     assert reify(e2, {a_lv: "blah"}) == e1
+
+
+def test_unification_direct():
+    import sys
+
+    uni = importorskip("unification")
+
+    from unification.core import isground, unground_lvars
+
+    from .test_core import gen_long_add_chain
+
+    var, unify, reify = uni.var, uni.unify, uni.reify
+
+    a_lv, b_lv = var(), var()
+
+    # Arity and operator mismatches
+    assert unify(etuple(add, 1, 2), etuple(add, 1), {}) is False
+    assert unify(etuple(add, a_lv), etuple(sub, 1), {}) is False
+    assert unify(etuple(add, etuple(add, 1)), etuple(add, (add, 1)), {}) == {}
+    assert unify(etuple(add, a_lv, a_lv), etuple(add, 1, 2), {}) is False
+    assert unify(etuple(add, a_lv, b_lv), etuple(add, b_lv, 1), {}) == {
+        a_lv: b_lv,
+        b_lv: 1,
+    }
+    assert unify(etuple(add, x=a_lv), etuple(add, y=1), {}) is False
+    assert unify(etuple(add, [a_lv]), etuple(add, [1]), {}) == {a_lv: 1}
+
+    # Unchanged nodes are returned as-is, and shared ones stay shared
+    et_1 = etuple(add, 1, 2)
+    et_2 = etuple(add, a_lv, 2)
+    et = etuple(add, et_1, et_2, et_2, x=et_1)
+    res = reify(et, {b_lv: 1})
+    assert res is et
+
+    res = reify(et, {a_lv: 1})
+    assert res == etuple(add, et_1, etuple(add, 1, 2), etuple(add, 1, 2), x=et_1)
+    assert res[1] is et_1
+    assert res[2] is res[3]
+    assert res[4].value is et_1
+
+    res = reify(et, {a_lv: [b_lv], b_lv: 3})
+    assert res[2] == etuple(add, [3], 2)
+
+    # Nested `tuple`s and `list`s without logic variables don't count as
+    # changes, so cached evaluations are kept
+    et_3 = etuple(add, (1, 2), [3], 4)
+    et_3._evaled_obj = 5
+    res = reify(et_3, {a_lv: 1})
+    assert res is et_3
+    assert res._evaled_obj == 5
+
+    res = reify(etuple(add, (1, a_lv), [3], et_3), {a_lv: 1})
+    assert res == etuple(add, (1, 1), [3], et_3)
+    assert res[3] is et_3
+
+    # Arena handles produce new elements on every access
+    arena_et = TermArena().add(etuple(add, etuple(add, a_lv, 1), 2))
+    assert reify(arena_et, {a_lv: 5}) == etuple(add, etuple(add, 5, 1), 2)
+    assert reify(arena_et, {b_lv: 5}) is arena_et
+
+    res = reify(et, {a_lv: etuple(add, b_lv, 1), b_lv: 3})
+    assert res[2] == etuple(add, etuple(add, 3, 1), 2)
+
+    assert not isground(et, {})
+    assert isground(et, {a_lv: 1})
+    assert unground_lvars(et, {a_lv: b_lv}) == {b_lv}
+
+    r_limit = sys.getrecursionlimit()
+
+    try:
+        sys.setrecursionlimit(100)
+        a = gen_long_add_chain(200)
+        b = gen_long_add_chain(200, num=a_lv)
+        assert unify(a, gen_long_add_chain(200), {}) == {}
+        assert unify(b, a, {}) == {a_lv: 1}
+        assert reify(b, {a_lv: 1}) == a
+    finally:
+        sys.setrecursionlimit(r_limit)
@@ -0,0 +1,152 @@
+import sys
+from decimal import Decimal
+from operator import add, mul, neg, sub, truediv
+
+import pytest
+from unification import var
+
+from etuples.core import ExpressionTuple, KwdPair, etuple
+from etuples.egraph import EGraph, ast_size
+
+from .test_core import gen_long_add_chain
+
+x_lv, y_lv, z_lv = var(), var(), var()
+
+arith_rules = [
+    (etuple(add, x_lv, 0), x_lv),
+    (etuple(mul, x_lv, 1), x_lv),
+    (etuple(mul, x_lv, 0), 0),
+    (etuple(sub, x_lv, x_lv), 0),
+    (etuple(add, x_lv, y_lv), etuple(add, y_lv, x_lv)),
+    (etuple(mul, x_lv, y_lv), etuple(mul, y_lv, x_lv)),
+    (
+        etuple(add, etuple(add, x_lv, y_lv), z_lv),
+        etuple(add, x_lv, etuple(add, y_lv, z_lv)),
+    ),
+    (etuple(neg, etuple(neg, x_lv)), x_lv),
+]
+
+
+def test_EGraph_add():
+    eg = EGraph()
+
+    a = etuple(add, 1, 2)
+    c_1 = eg.add(etuple(mul, a, a))
+    c_2 = eg.add(etuple(mul, etuple(add, 1, 2), etuple(add, 1, 2)))
+
+    # Hash-consing
+    assert c_1 == c_2
+    assert eg.add(a) == eg.ematch(etuple(add, 1, 2))[0][0]
+    # `mul`, `add`, `1`, `2`, `add(1, 2)`, `mul(...)`
+    assert len(eg) == 6
+
+    assert eg.add(1) == eg.add(1)
+    assert eg.add([1]) != eg.add([1])
+    assert eg.add(KwdPair("a", 1)) == eg.add(KwdPair("a", 1))
+
+    # Equal leaves that aren't interchangeable are kept apart
+    e_pos = etuple(truediv, 1.0, 0.0)
+    e_neg = etuple(truediv, 1.0, -0.0)
+    c_pos, c_neg = eg.add(e_pos), eg.add(e_neg)
+    assert c_pos != c_neg
+    assert str(eg.extract(c_neg)[2]) == "-0.0"
+    assert eg.add(Decimal("1")) != eg.add(Decimal("1.00"))
+
+    res = eg.extract(c_1)
+    assert isinstance(res, ExpressionTuple)
+    assert res == etuple(mul, a, a)
+    assert res.evaled_obj == 9
+
+    r_limit = sys.getrecursionlimit()
+
+    try:
+        sys.setrecursionlimit(100)
+        et = gen_long_add_chain(200)
+        cid = eg.add(et)
+        assert eg.extract(cid) == et
+    finally:
+        sys.setrecursionlimit(r_limit)
+
+
+def test_EGraph_union():
+    eg = EGraph()
+
+    c_x = eg.add(etuple(neg, "x"))
+    c_y = eg.add("y")
+    c_1 = eg.add(etuple(mul, etuple(neg, "x"), 2))
+    c_2 = eg.add(etuple(mul, "y", 2))
+    assert c_1 != c_2
+
+    eg.union(c_x, c_y)
+    eg.rebuild()
+
+    # Congruence closure
+    assert eg.find(c_1) == eg.find(c_2)
+    assert eg.extract(c_1) == etuple(mul, "y", 2)
+
+
+def test_EGraph_ematch():
+    eg = EGraph()
+    cid = eg.add(etuple(add, etuple(mul, "a", "a"), etuple(mul, "a", "b")))
+
+    res = eg.ematch(etuple(mul, x_lv, x_lv))
+    assert len(res) == 1
+    assert res[0][1] == {x_lv: eg.add("a")}
+
+    res = eg.ematch(etuple(mul, "a", y_lv))
+    assert {s[y_lv] for _, s in res} == {eg.add("a"), eg.add("b")}
+
+    assert eg.ematch(etuple(add, x_lv, y_lv), cid=cid)[0][0] == cid
+    assert eg.ematch(etuple(add, x_lv), cid=cid) == []
+    assert eg.ematch(etuple(sub, x_lv, y_lv)) == []
+
+
+@pytest.mark.parametrize(
+    "expr, expected",
+    [
+        (etuple(add, etuple(mul, "a", 1), 0), "a"),
+        (
+            etuple(mul, etuple(add, "a", etuple(neg, etuple(neg, "b"))), 1),
+            etuple(add, "a", "b"),
+        ),
+        (etuple(add, etuple(mul, 0, "a"), etuple(sub, "b", "b")), 0),
+        (etuple(add, etuple(add, "a", 0), etuple(mul, 1, "b")), etuple(add, "a", "b")),
+    ],
+)
+def test_EGraph_saturate(expr, expected):
+    eg = EGraph()
+    cid = eg.add(expr)
+
+    iters = eg.saturate(arith_rules, max_iters=10)
+    assert 0 < iters <= 10
+
+    res = eg.extract(cid)
+    assert res == expected or res == etuple(add, "b", "a")
+
+
+def test_EGraph_extract():
+    eg = EGraph()
+    cid = eg.add(etuple(add, 2, 3))
+    eg.saturate(arith_rules, max_iters=5)
+
+    def cost_fn(op, arg_costs):
+        if op is add and arg_costs:
+            return 1 + 10 * arg_costs[0] + sum(arg_costs)
+        return 1 + sum(arg_costs)
+
+    assert eg.extract(cid) in (etuple(add, 2, 3), etuple(add, 3, 2))
+    assert eg.extract(cid, cost_fn=cost_fn).evaled_obj == 5
+    assert ast_size(None, (1, 2)) == 4
+
+    et = etuple(add, etuple(add, etuple(add, etuple(add, "a", "b"), "c"), "d"), "e")
+
+    eg = EGraph()
+    eg.add(et)
+    iters = eg.saturate(arith_rules)
+
+    eg = EGraph()
+    cid = eg.add(et)
+    assert eg.saturate(arith_rules, max_nodes=20) < iters
+    assert eg.num_nodes > 20
+    assert sorted(eg.extract(cid).evaled_obj) == list("abcde")
+    assert ast_size(None, ()) == 1
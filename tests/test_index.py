@@ -0,0 +1,146 @@
+import sys
+from operator import add, mul, neg
+
+import pytest
+
+from etuples.core import _UNHASHABLE, KwdPair, etuple
+from etuples.index import SubtermIndex
+
+from .test_core import gen_long_add_chain
+
+
+def check_index(index):
+    """Compare an index with one that's built from scratch."""
+    new_index = SubtermIndex(index.root)
+    assert index._nodes == new_index._nodes
+    assert index._parents == new_index._parents
+    assert index._by_rator == new_index._by_rator
+    assert index._occurrences == new_index._occurrences
+
+
+def test_SubtermIndex():
+    sub = etuple(add, "x", 1)
+    et = etuple(mul, sub, etuple(neg, etuple(add, "x", 1)), [2], kw=sub)
+    index = SubtermIndex(et)
+
+    assert index[()] is et
+    assert index[(1,)] is sub
+    assert index[(2, 1, 2)] == 1
+    assert index[(4,)] is sub
+    with pytest.raises(KeyError):
+        index[(1, 1, 0)]
+
+    assert sorted(index.with_rator(add)) == [
+        ((1,), sub),
+        ((2, 1), et[2][1]),
+        ((4,), sub),
+    ]
+    assert index.with_rator(mul) == [((), et)]
+    assert index.with_rator(sub) == []
+    assert index.with_rator([]) == []
+
+    assert sorted(index.occurrences(sub)) == [(1,), (2, 1), (4,)]
+    assert sorted(index.occurrences("x")) == [(1, 1), (2, 1, 1), (4, 1)]
+    assert index.occurrences(etuple(add, "y", 1)) == []
+    # Equal values of different types are distinguished
+    assert index.occurrences(True) == []
+    with pytest.raises(TypeError):
+        index.occurrences([2])
+
+    assert sorted(p for p, _ in index.parents(sub)) == [(), (2,)]
+    assert sorted(p for p, _ in index.parents("x")) == [(1,), (2, 1), (4,)]
+    assert index.parents(et[2]) == [((), et)]
+    assert index.parents(etuple(neg, "x")) == []
+    # Sub-terms containing unhashable values aren't indexed
+    with pytest.raises(TypeError):
+        index.parents(et)
+
+
+def test_SubtermIndex_replace():
+    sub = etuple(add, "x", 1)
+    et = etuple(mul, sub, etuple(neg, etuple(add, "x", 1)), kw=sub)
+    index = SubtermIndex(et)
+
+    new_root = index.replace((2, 1), etuple(mul, "y", 2))
+    assert index.root is new_root
+    assert new_root == etuple(mul, sub, etuple(neg, etuple(mul, "y", 2)), kw=sub)
+    # Untouched sub-terms are kept
+    assert new_root[1] is sub
+    check_index(index)
+
+    assert sorted(index.occurrences(sub)) == [(1,), (3,)]
+    assert sorted(p for p, _ in index.with_rator(mul)) == [(), (2, 1)]
+
+    # Replace an operator
+    index.replace((1, 0), neg)
+    assert index.root[1] == etuple(neg, "x", 1)
+    check_index(index)
+
+    # Replace a keyword argument's value
+    index.replace((3,), 3)
+    assert index.root[3] == KwdPair("kw", 3)
+    assert index.occurrences(sub) == []
+    check_index(index)
+
+    index.replace((), etuple(add, 1, 2))
+    assert index.root == etuple(add, 1, 2)
+    check_index(index)
+
+
+def test_SubtermIndex_shared():
+    # Each level uses the one below it twice, so there are `2**12` paths to
+    # the leaf, but only 12 distinct nodes
+    et = "x"
+    for i in range(12):
+        et = etuple(add, et, et)
+
+    index = SubtermIndex(et)
+    assert len(index._nodes) == 12
+    assert len(index.with_rator(add)) == 2**12 - 1
+    assert len(index.occurrences("x")) == 2**12
+    assert len(index.parents(et[1])) == 1
+
+    # Only the sub-term at the given path is replaced
+    index.replace((1,) * 11 + (2,), "y")
+    assert index.occurrences("y") == [(1,) * 11 + (2,)]
+    assert len(index.occurrences("x")) == 2**12 - 1
+    assert len(index._nodes) == 12 + 11
+    assert index.root[2] is et[2]
+    check_index(index)
+
+    # Replacing a sub-term with one of its own sub-terms
+    index.replace((), index.root[2])
+    assert index.root is et[2]
+    assert len(index._nodes) == 11
+    check_index(index)
+
+    # Equal, but distinct, roots
+    index = SubtermIndex(etuple(add, 1, 2))
+    index.replace((), etuple(add, 1, 2))
+    assert index.occurrences(etuple(add, 1, 2)) == [()]
+    check_index(index)
+
+
+def test_SubtermIndex_recursion_limit():
+    et = gen_long_add_chain(200)
+
+    r_limit = sys.getrecursionlimit()
+
+    try:
+        sys.setrecursionlimit(100)
+        index = SubtermIndex(et)
+        assert len(index.with_rator(add)) == 200
+        assert index.occurrences(et[2][2]) == [(2, 2)]
+
+        index.replace((2,) * 150, 2)
+        assert index.root.evaled_obj == 152
+        assert len(index.with_rator(add)) == 150
+
+        # Nodes above an unhashable leaf aren't walked again
+        index.replace((2,) * 150, etuple(add, [1], 1))
+        assert index.occurrences(et[2][2]) == []
+        assert index.root._hash is _UNHASHABLE
+        assert index[(2,) * 150]._hash is _UNHASHABLE
+        assert len(index.with_rator(add)) == 151
+    finally:
+        sys.setrecursionlimit(r_limit)
@@ -0,0 +1,37 @@
+import subprocess
+import sys
+
+import etuples
+
+
+def test_version():
+    import importlib.metadata
+
+    assert etuples.__version__ == importlib.metadata.version("etuples")
+
+
+def test_import_time():
+    """Make sure that importing `etuples` doesn't pull in unnecessary modules."""
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import etuples"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # Each line has the form "import time: <self us> | <cumulative us> | <name>"
+    imports = set()
+    for line in res.stderr.splitlines()[1:]:
+        _, _, name = line.split("|")
+        imports.add(name.strip())
+
+    assert "etuples" in imports
+
+    # These are only needed by optional features (or not at all)
+    disallowed = {
+        "etuples.arena",
+        "etuples.egraph",
+        "etuples.index",
+        "packaging",
+    }
+    assert not imports & disallowed
@@ -0,0 +1,139 @@
+import sys
+from collections.abc import Mapping
+from operator import add, mul, neg
+
+from cons import cons
+from unification import var
+from unification.core import _reify, _unify, construction_sentinel
+
+from etuples.core import ExpressionTuple, KwdPair, etuple
+from etuples.rewrite import Rewriter, rewrite
+
+from .test_core import gen_long_add_chain
+from .test_dispatch import Node, Operator
+
+x_lv, y_lv = var(), var()
+
+rules = [
+    (etuple(add, x_lv, 0), x_lv),
+    (etuple(mul, x_lv, 1), x_lv),
+    (etuple(neg, etuple(neg, x_lv)), x_lv),
+]
+
+
+def test_rewrite():
+    assert rewrite(etuple(add, etuple(mul, "a", 1), 0), rules) == "a"
+    assert rewrite("a", rules) == "a"
+
+    et = etuple(mul, etuple(neg, etuple(neg, etuple(add, 2, 0))), 3)
+    res = rewrite(et, rules)
+    assert res == etuple(mul, 2, 3)
+    assert res.evaled_obj == 6
+
+    # Unchanged sub-terms, and their cached evaluations, are kept
+    unchanged = etuple(add, 1, 2)
+    assert unchanged.evaled_obj == 3
+    et = etuple(mul, etuple(add, unchanged, 0), etuple(neg, unchanged))
+    res = rewrite(et, rules)
+    assert res[1] is unchanged
+    assert res[2] is et[2]
+    assert res[1]._evaled_obj == 3
+
+    assert rewrite(unchanged, rules) is unchanged
+
+    # Keyword arguments
+    et = etuple(dict, a=etuple(add, "b", 0))
+    assert rewrite(et, rules)._tuple == (dict, KwdPair("a", "b"))
+
+    # Rules can use `cons` patterns
+    res = rewrite(etuple(add, 1, 2), [(cons(add, x_lv), cons(mul, x_lv))])
+    assert isinstance(res, ExpressionTuple)
+    assert res == etuple(mul, 1, 2)
+
+
+def test_Rewriter_memo():
+    shared = etuple(add, etuple(mul, "a", 1), 0)
+    et = etuple(mul, etuple(neg, shared), etuple(neg, shared))
+
+    rewriter = Rewriter(rules)
+    res = rewriter(et)
+    assert res == etuple(mul, etuple(neg, "a"), etuple(neg, "a"))
+
+    # `shared` was only normalized once
+    assert rewriter.stats == {0: 1, 1: 1}
+
+    # Normal forms are remembered across calls
+    assert rewriter(shared) == "a"
+    assert rewriter(etuple(neg, shared))[1] == "a"
+    assert rewriter.stats == {0: 1, 1: 1}
+
+    rewriter.clear()
+    assert rewriter.stats == {}
+    assert rewriter(shared) == "a"
+    assert rewriter.stats == {0: 1, 1: 1}
+
+    # Equal sub-terms that are distinct objects
+    et = etuple(
+        mul,
+        etuple(neg, etuple(add, etuple(mul, "a", 1), 0)),
+        etuple(neg, etuple(add, etuple(mul, "a", 1), 0)),
+        etuple(neg, etuple(add, "a", 0)),
+    )
+    res = rewrite(et, rules)
+    assert res[1] is not res[2]
+
+    rewriter = Rewriter(rules, structural=True)
+    res = rewriter(et)
+    assert res == etuple(mul, etuple(neg, "a"), etuple(neg, "a"), etuple(neg, "a"))
+    assert res[1] is res[2] is res[3]
+    assert rewriter.stats == {0: 1, 1: 1}
+
+    rewriter.clear()
+    assert rewriter._structural_memo == {}
+    assert rewriter(etuple(add, [1], 0)) == [1]
+
+
+def _unify_Node(u, v, s):
+    s = yield _unify(u.rator, v.rator, s)
+    if s is not False:
+        s = yield _unify(u.rands, v.rands, s)
+    yield s
+
+
+def _reify_Node(u, s):
+    u_rator = yield _reify(u.rator, s)
+    u_rands = yield _reify(u.rands, s)
+    yield construction_sentinel
+    yield Node(u_rator, u_rands)
+
+
+_unify.add((Node, Node, Mapping), _unify_Node)
+_reify.add((Node, Mapping), _reify_Node)
+
+
+def test_rewrite_generic():
+    op_add, op_mul = Operator("+"), Operator("*")
+
+    gen_rules = [(Node(op_mul, [x_lv, 1]), x_lv)]
+
+    node = Node(op_add, [Node(op_mul, [Node(op_mul, ["a", 1]), 1]), 2])
+    res = rewrite(node, gen_rules)
+    assert res == Node(op_add, ["a", 2])
+    assert isinstance(res.rands, list)
+
+    node = Node(op_add, ["a", 2])
+    assert rewrite(node, gen_rules) is node
+
+
+def test_rewrite_recursion_limit():
+    et = gen_long_add_chain(200, num=0)
+
+    r_limit = sys.getrecursionlimit()
+
+    try:
+        sys.setrecursionlimit(200)
+        rewriter = Rewriter(rules)
+        assert rewriter(et) == 0
+        assert rewriter.stats == {0: 200}
+    finally:
+        sys.setrecursionlimit(r_limit)